@@ -2,12 +2,27 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import random
 from midiutil import MIDIFile
+from mido import tempo2bpm
 import pygame
 import os
+import json
+import uuid
 from time import sleep
+from profiling import stage, profiled_run
+from ngram import ChordNgramModel
+from fenwick import WeightedSampler
+import syllables
+from melody import LYRICS_PATH, read_song_lyrics
+from timebase import PPQ, DEFAULT_TEMPO_MAP
+from fingerprint import SongIndex, song_shingles, generate_unique
+
+# Chord model learned by corpus.py; used instead of the hand-typed edges when present
+CHORD_MODEL_PATH = os.path.join('createdFiles', 'chord_model.json')
+# Fingerprints of every progression generated so far, used to avoid near-duplicates
+PROGRESSION_INDEX_PATH = os.path.join('createdFiles', 'progression_index.sqlite')
 
 class ChordProgressionGenerator:
-    def __init__(self):
+    def __init__(self, model_path=None):
         # Previous initialization code remains the same
         self.keys = {
             'C': {
@@ -36,11 +51,17 @@ class ChordProgressionGenerator:
             'G': 67, 'G#': 68, 'A': 69, 'B': 71
         }
         
+        # Bumped on every change to the transitions, so cached progressions can tell they are stale
+        self.version = 0
         self.create_chord_graphs()
+        self.ngram_models = {}
+        if model_path is not None:
+            self.load_chord_model(model_path)
         
     def create_chord_graphs(self):
         """Create directed graphs for different keys"""
         self.graphs = {}
+        self.samplers = {}  # key -> chord -> WeightedSampler over its outgoing edges
         
         # Create graph for C major
         self.graphs['C'] = nx.DiGraph()
@@ -68,6 +89,81 @@ class ChordProgressionGenerator:
             ('V', 'i', 0.5), ('V', 'VI', 0.3)  # Added dominant chord transitions
         ]
         self.graphs['Am'].add_weighted_edges_from(a_minor_edges)
+        self.refresh_samplers()
+
+    def refresh_samplers(self, key=None):
+        """
+        Rebuild the per-chord transition samplers from the graphs (all keys when key is None).
+        Only needed after editing self.graphs directly; set_transition and remove_transition
+        keep graph and samplers in sync.
+        """
+        for graph_key in [key] if key is not None else list(self.graphs):
+            graph = self.graphs[graph_key]
+            self.samplers[graph_key] = {
+                chord: WeightedSampler({next_chord: data['weight'] for next_chord, data in graph[chord].items()})
+                for chord in graph.nodes
+            }
+        self.version += 1
+
+    def set_transition(self, key, chord, next_chord, weight):
+        """
+        Change the weight of a transition, adding it when it does not exist yet.
+        Takes effect from the next generated chord, in O(log d) for a chord with d successors.
+        The learned n-gram successors of `chord` are dropped, so the edited graph also decides
+        what follows it when generating with order > 1.
+        """
+        for numeral in (chord, next_chord):
+            if numeral not in self.keys[key]:
+                raise ValueError(f"Unknown chord '{numeral}' in key {key}; add its notes to keys['{key}'] first")
+        self.graphs[key].add_edge(chord, next_chord, weight=weight)
+        samplers = self.samplers.setdefault(key, {})
+        samplers.setdefault(next_chord, WeightedSampler())
+        samplers.setdefault(chord, WeightedSampler()).set(next_chord, weight)
+        self._transitions_edited(key, chord)
+
+    def _transitions_edited(self, key, chord):
+        if key in self.ngram_models:
+            self.ngram_models[key].forget(chord)
+        self.version += 1
+
+    def remove_transition(self, key, chord, next_chord):
+        """
+        Remove a transition from the graph and its sampler (and the learned n-gram successors
+        of `chord`, as in set_transition).
+        """
+        self.graphs[key].remove_edge(chord, next_chord)
+        self.samplers[key][chord].remove(next_chord)
+        self._transitions_edited(key, chord)
+
+    def load_chord_model(self, model_path):
+        """
+        Replace the hand-typed edges with transition weights learned by corpus.py.
+        Keys missing from the model keep their default graph.
+        """
+        with open(model_path, 'r') as f:
+            data = json.load(f)
+        model = data['model']
+
+        for key, transitions in model.items():
+            if key not in self.keys:
+                continue
+            graph = nx.DiGraph()
+            graph.add_nodes_from(self.keys[key])
+            graph.add_weighted_edges_from(
+                (chord, next_chord, weight)
+                for chord, targets in transitions.items()
+                for next_chord, weight in targets.items()
+                if chord in self.keys[key] and next_chord in self.keys[key]
+            )
+            self.graphs[key] = graph
+            self.refresh_samplers(key)
+
+        # Higher-order contexts, used by generate_section when order > 1
+        for key, counts in data.get('ngrams', {}).items():
+            if key in self.keys:
+                self.ngram_models[key] = ChordNgramModel.from_counts(list(self.keys[key]), counts)
+        self.version += 1
+        print(f"Loaded chord model from '{model_path}'")
     
     def visualize_graphs(self, folder_name='createdFiles', save_path_prefix='chord_graph', display=True):
         """Visualize and save chord progression graphs for both keys"""
@@ -121,37 +217,44 @@ class ChordProgressionGenerator:
         print(f"Graph visualization saved as '{file_path}'")
 
     # Rest of the class methods remain the same
-    def generate_section(self, key, length=4, start=None):
-        """Generate a chord progression in specified key"""
+    def generate_section(self, key, length=4, start=None, order=1, rng=random):
+        """
+        Generate a chord progression in specified key.
+        With order > 1 and a learned n-gram model for the key, each chord is conditioned on
+        up to `order` previous chords, backing off to shorter contexts and finally to the graph.
+        Pass a seeded random.Random as `rng` for reproducible progressions.
+        """
         if start is None:
             start = 'I' if key == 'C' else 'i'
             
         progression = [start]
         current = start
-        graph = self.graphs[key]
+        samplers = self.samplers[key]
+        ngram_model = self.ngram_models.get(key) if order > 1 else None
         
         for _ in range(length - 1):
-            neighbors = list(graph.neighbors(current))
-            if not neighbors:
+            if ngram_model is not None:
+                next_chord = ngram_model.next_chord(progression, order, rng)
+                if next_chord is not None:
+                    current = next_chord
+                    progression.append(current)
+                    continue
+
+            sampler = samplers.get(current)
+            next_chord = sampler.sample(rng) if sampler is not None else None
+            if next_chord is None:
                 break
-                
-            weights = [graph[current][next_chord]['weight'] for next_chord in neighbors]
-            current = random.choices(neighbors, weights=weights)[0]
+            current = next_chord
             progression.append(current)
             
         return progression
     
-    def create_multi_section_midi(self, sections, folder_name='createdFiles', filename='chords.mid'):
-        """Create a MIDI file with multiple sections"""
-        os.makedirs(folder_name, exist_ok=True)  # Ensure the folder exists
-        file_path = os.path.join(folder_name, filename)
-
-        mf = MIDIFile(1)
+    def create_multi_section_midi(self, sections, folder_name='createdFiles', filename='chords.mid',
+                                  tempo_map=DEFAULT_TEMPO_MAP):
+        """Create a MIDI file with multiple sections on the shared timebase"""
+        mf = self._midi_with_tempo_map("Multi-Section Progression", tempo_map)
         track = 0
         time = 0
-        mf.addTrackName(track, time, "Multi-Section Progression")
-        mf.addTempo(track, time, 120)
-
         for section_key, progression in sections:
             for chord_numeral in progression:
                 chord_notes = self.keys[section_key][chord_numeral]
@@ -161,6 +264,35 @@ class ChordProgressionGenerator:
                 time += 2
             time += 1  # Pause between sections
 
+        return self._save_midi(mf, folder_name, filename)
+
+    def create_bar_aligned_midi(self, bars, folder_name='createdFiles', filename='chords.mid',
+                                tempo_map=DEFAULT_TEMPO_MAP):
+        """
+        Create a MIDI file with one chord held over each given stretch of the song, e.g. every bar
+        of the lyric bar grid (see chords_on_lyric_bars).
+
+        Args:
+            bars (list): (start tick, length in ticks, key, chord numeral) tuples.
+        """
+        mf = self._midi_with_tempo_map("Lyric-Aligned Progression", tempo_map)
+        for start, length, key, chord_numeral in bars:
+            for note in self.keys[key][chord_numeral]:
+                mf.addNote(0, 0, self.note_to_midi[note], start / tempo_map.ppq, length / tempo_map.ppq, 100)
+        return self._save_midi(mf, folder_name, filename)
+
+    def _midi_with_tempo_map(self, track_name, tempo_map):
+        mf = MIDIFile(1, ticks_per_quarternote=PPQ)
+        mf.addTrackName(0, 0, track_name)
+        for beat, tempo in zip(tempo_map.ticks_to_beats(tempo_map.tempo_ticks), tempo_map.tempos):
+            mf.addTempo(0, beat, tempo2bpm(int(tempo)))
+        for tick, numerator, denominator in tempo_map.time_signatures:
+            mf.addTimeSignature(0, tick / PPQ, numerator, denominator.bit_length() - 1, 24)
+        return mf
+
+    def _save_midi(self, mf, folder_name, filename):
+        os.makedirs(folder_name, exist_ok=True)  # Ensure the folder exists
+        file_path = os.path.join(folder_name, filename)
         with open(file_path, 'wb') as outf:
             mf.writeFile(outf)
 
@@ -184,14 +316,58 @@ class ChordProgressionGenerator:
             pygame.mixer.quit()
             pygame.quit()
 
+def chords_on_lyric_bars(song_lyrics, line_starts, line_lengths, section_progressions, bar_ticks):
+    """
+    One chord per bar of the lyric bar grid (see syllables.line_layout). Each run of lines of a
+    section walks through that section's progression, wrapping around as often as needed.
+
+    Args:
+        song_lyrics (list): (line, section) pairs.
+        line_starts (array): Start tick of every line.
+        line_lengths (array): Length of every line in ticks (whole bars).
+        section_progressions (dict): Section name -> (key, progression); sections not listed
+            use the first entry.
+        bar_ticks (int): Bar length in ticks.
+
+    Returns:
+        list: (start tick, length, key, chord numeral) tuples for create_bar_aligned_midi.
+    """
+    default = next(iter(section_progressions.values()))
+    bars = []
+    previous_section = None
+    for (_, section), start, length in zip(song_lyrics, line_starts.tolist(), line_lengths.tolist()):
+        if section != previous_section:
+            previous_section = section
+            position = 0
+        key, progression = section_progressions.get(section, default)
+        for bar_start in range(start, start + length, bar_ticks):
+            bars.append((bar_start, bar_ticks, key, progression[position % len(progression)]))
+            position += 1
+    return bars
+
 def main():
     # Initialize the generator
-    generator = ChordProgressionGenerator()
+    with stage("graph build"):
+        model_path = CHORD_MODEL_PATH if os.path.exists(CHORD_MODEL_PATH) else None
+        generator = ChordProgressionGenerator(model_path)
     
     # Generate sections
-    verse = generator.generate_section('C', length=4)
-    chorus = generator.generate_section('C', length=4)
-    bridge = generator.generate_section('Am', length=4)
+    def generate_song():
+        # Conditioned on up to 3 previous chords when a learned n-gram model is loaded
+        verse = generator.generate_section('C', length=4, order=3)
+        chorus = generator.generate_section('C', length=4, order=3)
+        bridge = generator.generate_section('Am', length=4, order=3)
+        return verse, chorus, bridge
+
+    def progression_shingles(song):
+        verse, chorus, bridge = song
+        return song_shingles(chords=verse + chorus + bridge + chorus)
+
+    # Regenerate progressions that are near-duplicates of earlier ones
+    with stage("sampling"), SongIndex(PROGRESSION_INDEX_PATH) as index:
+        (verse, chorus, bridge), _ = generate_unique(
+            generate_song, progression_shingles, index, song_id=uuid.uuid4().hex
+        )
     
     # Print the progressions
     print(f"Verse (C major): {' -> '.join(verse)}")
@@ -200,7 +376,8 @@ def main():
     
     # Visualize and display the graphs
     print("\nDisplaying chord progression graphs...")
-    generator.visualize_graphs(display=True)
+    with stage("render"):
+        generator.visualize_graphs(display=True)
     print("Graph visualization saved as 'chord_graph_combined.png'")
     
     # Create and play complete progression
@@ -210,10 +387,25 @@ def main():
         ('Am', bridge),
         ('C', chorus)
     ]
-    midi_path = generator.create_multi_section_midi(sections)
+    with stage("MIDI encode"):
+        if os.path.exists(LYRICS_PATH):
+            # Follow the bars of the lyric-aligned melody when lyrics.py has written the lyrics
+            song_lyrics = read_song_lyrics()
+            batch = syllables.syllabify_lines([line for line, _ in song_lyrics])
+            line_starts, line_lengths = syllables.line_layout(batch)
+            section_progressions = {
+                'Verse 1': ('C', verse), 'Verse 2': ('C', verse), 'Chorus': ('C', chorus), 'Bridge': ('Am', bridge),
+            }
+            bars = chords_on_lyric_bars(song_lyrics, line_starts, line_lengths, section_progressions,
+                                        DEFAULT_TEMPO_MAP.ticks_per_bar())
+            midi_path = generator.create_bar_aligned_midi(bars)
+        else:
+            midi_path = generator.create_multi_section_midi(sections)
 
     # Play the generated MIDI file
-    generator.play_midi(midi_path)
+    with stage("playback"):
+        generator.play_midi(midi_path)
 
 if __name__ == "__main__":
-    main()
+    with profiled_run("chords"):
+        main()
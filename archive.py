@@ -0,0 +1,276 @@
+import os
+import mmap
+import zlib
+import uuid
+import fnmatch
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from profiling import stage, profiled_run
+
+# File locks for appends from several processes (POSIX only; elsewhere use one writer process)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_ARCHIVE_PATH = os.path.join('createdFiles', 'songs.archive')
+INDEX_SUFFIX = '.sqlite'
+# Plain-text index of earlier archives, imported into the SQLite index on first open
+LEGACY_INDEX_SUFFIX = '.idx'
+# Files the pipeline writes for one song: plain names must exist, patterns may match nothing
+# (graph PNGs are only drawn by some runs, and the piano roll has one file per tile)
+SONG_ARTIFACTS = (
+    'lyrics.txt', 'lyrics_*_graph.png',
+    'chords.mid', 'chord_graph_combined.png',
+    'melody.mid', 'melody_*_graph.png', 'global_melody_graph.png',
+    'drum_pattern.mid', 'drum_*_graph.png', 'comprehensive_drum_graph.png',
+    'merged_song.mid', 'merged_song_thumb.png', 'merged_song_roll*.png',
+)
+
+
+class SongArchive:
+    """
+    All artifacts of many songs in one append-only data file, plus a SQLite index of
+    (song id, artifact name, offset, length, crc32) rows, so any artifact is found with one
+    B-tree lookup and read straight from a memory map of the data file.
+    Opening the archive reads nothing from the index, so appending a song costs the same
+    whatever the size of the catalog. Appends take an exclusive file lock, so worker processes
+    can write to the same archive.
+    """
+
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        # Append mode: every write lands at the end of the file, whichever process makes it
+        self._data = open(path, 'a+b')
+        self._map = None
+        self.conn = sqlite3.connect(self.index_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._locked():
+            new_index = not self.conn.execute("SELECT name FROM sqlite_master WHERE name = 'artifacts'").fetchone()
+            self.conn.execute("CREATE TABLE IF NOT EXISTS songs (song_id TEXT PRIMARY KEY)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts (song_id TEXT, name TEXT, offset INTEGER, "
+                "length INTEGER, crc INTEGER, PRIMARY KEY (song_id, name))"
+            )
+            if new_index and os.path.exists(path + LEGACY_INDEX_SUFFIX):
+                self._import_legacy_index(path + LEGACY_INDEX_SUFFIX)
+            self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map = None
+        self._data.close()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    def __iter__(self):
+        return (song_id for song_id, in self.conn.execute("SELECT song_id FROM songs ORDER BY rowid"))
+
+    def __contains__(self, song_id):
+        return self.conn.execute("SELECT 1 FROM songs WHERE song_id = ?", (song_id,)).fetchone() is not None
+
+    def _import_legacy_index(self, legacy_path):
+        """
+        Copy the lines of a plain-text index ((song id, name, offset, length, crc32) per line)
+        into the SQLite index. An incomplete last line (a crashed writer) is skipped.
+        """
+        with open(legacy_path, 'rb') as f:
+            rows = [
+                line.decode().rstrip("\n").split("\t")
+                for line in f if line.endswith(b"\n")
+            ]
+        self.conn.executemany("INSERT OR IGNORE INTO songs VALUES (?)", ((row[0],) for row in rows))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?)",
+            ((song_id, name, int(offset), int(length), int(crc, 16)) for song_id, name, offset, length, crc in rows),
+        )
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._data.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._data.fileno(), fcntl.LOCK_UN)
+
+    def append(self, song_id, artifacts, sync=False):
+        """
+        Append the artifacts of one song.
+
+        Args:
+            song_id (str): Unique song id.
+            artifacts (dict): Artifact name (e.g. 'melody.mid') -> bytes.
+            sync (bool): fsync the data and the index before returning, so the song survives a power loss.
+        """
+        for text in (song_id, *artifacts):
+            if not text:
+                raise ValueError("Song ids and artifact names cannot be empty")
+        with self._locked():
+            if song_id in self:
+                raise ValueError(f"Song '{song_id}' is already in '{self.path}'")
+
+            # The data goes in before its index rows, so the index never points past the data
+            offset = os.fstat(self._data.fileno()).st_size
+            rows = []
+            for name, data in artifacts.items():
+                self._data.write(data)
+                rows.append((song_id, name, offset, len(data), zlib.crc32(data)))
+                offset += len(data)
+            self._data.flush()
+            if sync:
+                os.fsync(self._data.fileno())
+                self.conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with self.conn:
+                    self.conn.execute("INSERT INTO songs VALUES (?)", (song_id,))
+                    self.conn.executemany("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)", rows)
+            finally:
+                if sync:
+                    self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def names(self, song_id):
+        """
+        Artifact names of a song, in the order they were appended.
+        """
+        names = [name for name, in self.conn.execute(
+            "SELECT name FROM artifacts WHERE song_id = ? ORDER BY rowid", (song_id,))]
+        if not names and song_id not in self:
+            raise KeyError(song_id)
+        return names
+
+    def _entry(self, song_id, name):
+        row = self.conn.execute(
+            "SELECT offset, length, crc FROM artifacts WHERE song_id = ? AND name = ?", (song_id, name)
+        ).fetchone()
+        if row is None:
+            raise KeyError((song_id, name))
+        return row
+
+    def view(self, song_id, name):
+        """
+        Zero-copy view of an artifact in the memory-mapped data file.
+        Valid while the archive is open.
+        """
+        offset, length, _ = self._entry(song_id, name)
+        return self._view(offset, length)
+
+    def _view(self, offset, length):
+        if not length:
+            return memoryview(b"")
+        if self._map is None or offset + length > len(self._map):
+            # The file has grown since it was mapped; views of the old map stay valid
+            self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._map)[offset:offset + length]
+
+    def read(self, song_id, name):
+        """
+        Read one artifact, checking its crc32.
+
+        Returns:
+            bytes: The artifact.
+        """
+        offset, length, crc = self._entry(song_id, name)
+        data = bytes(self._view(offset, length))
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"Artifact '{name}' of song '{song_id}' is corrupt")
+        return data
+
+    def extract(self, song_id, folder_name):
+        """
+        Write the artifacts of a song back out as files.
+
+        Returns:
+            list: The paths written.
+        """
+        os.makedirs(folder_name, exist_ok=True)
+        paths = []
+        for name in self.names(song_id):
+            file_path = os.path.join(folder_name, name)
+            with open(file_path, 'wb') as f:
+                f.write(self.read(song_id, name))
+            paths.append(file_path)
+        return paths
+
+
+def collect_artifacts(folder_name, names=SONG_ARTIFACTS):
+    """
+    Read the artifacts of one song from a folder (not its subfolders), keyed by file name.
+    Only the listed files are read, so other songs' files and leftovers in the folder are not picked up.
+
+    Args:
+        folder_name (str): Folder the pipeline wrote the song to.
+        names (iterable): File names, or glob patterns such as 'melody_*_graph.png'.
+
+    Returns:
+        dict: File name -> bytes, in name order.
+    """
+    files = {name for name in os.listdir(folder_name) if os.path.isfile(os.path.join(folder_name, name))}
+    picked = set()
+    for name in names:
+        if any(c in name for c in "*?["):
+            picked.update(fnmatch.filter(files, name))
+        elif name in files:
+            picked.add(name)
+        else:
+            raise FileNotFoundError(f"Artifact '{name}' is missing from '{folder_name}'")
+
+    artifacts = {}
+    for name in sorted(picked):
+        with open(os.path.join(folder_name, name), 'rb') as f:
+            artifacts[name] = f.read()
+    return artifacts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store song artifacts in one indexed archive file.")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE_PATH, help="Archive data file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Append the artifacts of one song in a folder.")
+    pack.add_argument("folder", help="Folder the song's files were written to.")
+    pack.add_argument("names", nargs="*", default=SONG_ARTIFACTS,
+                      help="Artifact file names or glob patterns (the pipeline's outputs by default).")
+    pack.add_argument("--song-id", default=None, help="Song id (a new uuid by default).")
+    pack.add_argument("--remove", action="store_true",
+                      help="Delete the packed files once they are safely in the archive.")
+    commands.add_parser("list", help="List the songs in the archive.")
+    extract = commands.add_parser("extract", help="Write a song's artifacts back out as files.")
+    extract.add_argument("song_id")
+    extract.add_argument("folder")
+    args = parser.parse_args()
+
+    with SongArchive(args.archive) as archive:
+        if args.command == "pack":
+            song_id = args.song_id or uuid.uuid4().hex
+            with stage("pack", folder=args.folder):
+                artifacts = collect_artifacts(args.folder, args.names)
+                archive.append(song_id, artifacts, sync=args.remove)
+                if args.remove:
+                    for name in artifacts:
+                        os.remove(os.path.join(args.folder, name))
+            print(f"Stored {len(artifacts)} artifacts as song '{song_id}' in '{args.archive}'")
+        elif args.command == "list":
+            for song_id in archive:
+                print(f"{song_id}: {', '.join(archive.names(song_id))}")
+            print(f"{len(archive)} songs in '{args.archive}'")
+        else:
+            for file_path in archive.extract(args.song_id, args.folder):
+                print(f"Extracted '{file_path}'")
+
+
+if __name__ == "__main__":
+    with profiled_run("archive"):
+        main()
@@ -0,0 +1,487 @@
+import os
+
+# Benchmarks run headless: no display for matplotlib, no audio device for pygame
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import itertools
+from contextlib import redirect_stdout
+import numpy as np
+import networkx as nx
+from mido import Message, MidiFile, MidiTrack
+
+import drum
+import melody
+import lyrics
+import groove
+import merge_tracks
+import piano_roll
+import syllables
+from archive import SongArchive
+from Chords import ChordProgressionGenerator
+from timebase import NOTE_DTYPE, DEFAULT_TEMPO_MAP
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_THRESHOLD = 0.25  # 25% slower (or bigger) than the baseline counts as a regression
+# Differences below these floors are timer and allocator noise, not regressions
+MIN_DELTAS = {"p50_ms": 0.05, "peak_bytes": 4096}
+
+
+# Synthetic inputs
+def make_phrase_corpus(num_phrases, phrases_per_group=4):
+    """
+    Build a rhyme_groups-style dictionary with the requested number of phrases.
+    """
+    corpus = {}
+    for i in range(num_phrases):
+        group = f"G{i // phrases_per_group}"
+        corpus.setdefault(group, []).append(f"Synthetic phrase {i} of group {group}")
+    return corpus
+
+
+def make_lyric_lines(num_lines):
+    """
+    Repeat the song structure used by melody.py and drum.py up to the requested number of lines.
+    """
+    return [melody.lyrics[i % len(melody.lyrics)] for i in range(num_lines)]
+
+
+def write_long_track(file_path, num_notes):
+    """
+    Write a single-track MIDI file with `num_notes` notes.
+    """
+    mid = MidiFile()
+    track = MidiTrack()
+    mid.tracks.append(track)
+    for i in range(num_notes):
+        note = 48 + i % 36
+        track.append(Message('note_on', note=note, velocity=64, time=0))
+        track.append(Message('note_off', note=note, velocity=64, time=240))
+    mid.save(file_path)
+
+
+# Benchmark cases
+# Each setup function receives (size, work_dir) and returns (callable, items processed per call).
+def setup_generate_section(size, work_dir):
+    generator = ChordProgressionGenerator()
+    return (lambda: generator.generate_section('C', length=size)), size
+
+
+def make_wide_generator(num_chords, rng):
+    """
+    Add a key 'X' with `num_chords` chord types, each moving to half of the others.
+    """
+    generator = ChordProgressionGenerator()
+    chords = [f"X{i}" for i in range(num_chords)]
+    generator.keys['X'] = {chord: ['C', 'E', 'G'] for chord in chords}
+    graph = nx.DiGraph()
+    graph.add_weighted_edges_from(
+        (chord, next_chord, rng.random())
+        for chord in chords
+        for next_chord in rng.sample(chords, max(1, num_chords // 2))
+    )
+    generator.graphs['X'] = graph
+    generator.refresh_samplers('X')
+    return generator, chords
+
+
+def setup_generate_section_wide(size, work_dir):
+    generator, chords = make_wide_generator(size, random.Random(size))
+    return (lambda: generator.generate_section('X', length=256, start=chords[0])), 256
+
+
+def setup_set_transition(size, work_dir):
+    rng = random.Random(size)
+    generator, chords = make_wide_generator(size, rng)
+    edges = [(chord, next_chord) for chord, next_chord in generator.graphs['X'].edges][:256]
+
+    def update():
+        for chord, next_chord in edges:
+            generator.set_transition('X', chord, next_chord, rng.random())
+    return update, len(edges)
+
+
+def setup_create_multi_section_midi(size, work_dir):
+    generator = ChordProgressionGenerator()
+    sections = [('C', generator.generate_section('C', length=8)) for _ in range(size)]
+    return (lambda: generator.create_multi_section_midi(sections, folder_name=work_dir)), size * 8
+
+
+def setup_create_lyrics_graph(size, work_dir):
+    corpus = make_phrase_corpus(size)
+    return (lambda: lyrics.create_lyrics_graph(corpus)), size
+
+
+def setup_generate_lyrics(size, work_dir):
+    graph = lyrics.create_lyrics_graph(make_phrase_corpus(size))
+    return (lambda: lyrics.generate_lyrics(graph, ["G0", "G0", "G1", "G1"], num_lines=64)), 64
+
+
+def setup_generate_melody(size, work_dir):
+    lines = make_lyric_lines(size)
+    return (lambda: melody.generate_melody_pattern_with_recording(lines, melody.melody_map)), size
+
+
+def setup_melody_midi(size, work_dir):
+    notes, _ = melody.generate_melody_pattern_with_recording(make_lyric_lines(size), melody.melody_map)
+    return (lambda: melody.create_midi_file(notes, folder_name=work_dir)), len(notes)
+
+
+def setup_generate_drums(size, work_dir):
+    lines = make_lyric_lines(size)
+    return (lambda: drum.generate_drum_pattern(lines)), size
+
+
+def setup_drum_midi(size, work_dir):
+    sequence = drum.generate_drum_pattern(make_lyric_lines(size))
+    return (lambda: drum.create_midi_file(sequence, folder_name=work_dir)), len(sequence)
+
+
+def setup_merge(size, work_dir, num_tracks=8):
+    input_files = []
+    for i in range(num_tracks):
+        file_path = os.path.join(work_dir, f"track_{i}.mid")
+        write_long_track(file_path, size)
+        input_files.append(file_path)
+    output_file = os.path.join(work_dir, "merged.mid")
+    return (lambda: merge_tracks.merge_midi_files(input_files, output_file)), num_tracks * size * 2
+
+
+def setup_groove(size, work_dir):
+    rng = np.random.default_rng(0)
+    notes = np.zeros(size, dtype=NOTE_DTYPE)
+    notes['start'] = np.sort(rng.integers(0, size * 120, size))
+    notes['duration'] = 240
+    notes['channel'] = rng.choice([0, 1, 9], size)
+    notes['note'] = rng.integers(35, 84, size)
+    notes['velocity'] = 64
+    return (lambda: groove.apply_groove(notes)), size * 2
+
+
+def setup_groove_track(size, work_dir):
+    file_path = os.path.join(work_dir, "track.mid")
+    write_long_track(file_path, size)
+    track = MidiFile(file_path).tracks[0]
+    return (lambda: groove.groove_track(track)), size * 2
+
+
+def make_song_artifacts(rng):
+    """
+    Stand-ins for the artifacts of one song: a few MIDI files, the lyrics and a dozen graph PNGs.
+    """
+    artifacts = {name: rng.randbytes(2048) for name in ("chords.mid", "melody.mid", "drum_pattern.mid")}
+    artifacts["lyrics.txt"] = rng.randbytes(512)
+    artifacts.update((f"graph_{i}.png", rng.randbytes(16384)) for i in range(12))
+    return artifacts
+
+
+def setup_archive_write(size, work_dir):
+    artifacts = make_song_artifacts(random.Random(size))
+    archive = SongArchive(os.path.join(work_dir, "songs.archive"))
+    song_ids = itertools.count()
+
+    def write():
+        for _ in range(size):
+            archive.append(f"song-{next(song_ids)}", artifacts)
+    return write, size * len(artifacts)
+
+
+def setup_archive_open_append(size, work_dir):
+    """
+    What the workflow's pack step does for one song: open an archive already holding `size`
+    songs, append one more and close it.
+    """
+    artifacts = {f"artifact_{i}.png": bytes(64) for i in range(23)}
+    path = os.path.join(work_dir, "songs.archive")
+    with SongArchive(path) as archive:
+        for i in range(size):
+            archive.append(f"song-{i}", artifacts)
+    song_ids = itertools.count(size)
+
+    def open_append():
+        with SongArchive(path) as archive:
+            archive.append(f"song-{next(song_ids)}", artifacts)
+    return open_append, 1
+
+
+def setup_files_write(size, work_dir):
+    artifacts = make_song_artifacts(random.Random(size))
+    song_ids = itertools.count()
+
+    def write():
+        for _ in range(size):
+            folder = os.path.join(work_dir, f"song-{next(song_ids)}")
+            os.makedirs(folder)
+            for name, data in artifacts.items():
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(data)
+    return write, size * len(artifacts)
+
+
+def setup_archive_read(size, work_dir):
+    rng = random.Random(size)
+    artifacts = make_song_artifacts(rng)
+    archive = SongArchive(os.path.join(work_dir, "songs.archive"))
+    for i in range(size):
+        archive.append(f"song-{i}", artifacts)
+    lookups = [(f"song-{rng.randrange(size)}", rng.choice(list(artifacts))) for _ in range(1000)]
+
+    def read():
+        for song_id, name in lookups:
+            archive.read(song_id, name)
+    return read, len(lookups)
+
+
+def setup_files_read(size, work_dir):
+    rng = random.Random(size)
+    artifacts = make_song_artifacts(rng)
+    for i in range(size):
+        folder = os.path.join(work_dir, f"song-{i}")
+        os.makedirs(folder)
+        for name, data in artifacts.items():
+            with open(os.path.join(folder, name), 'wb') as f:
+                f.write(data)
+    lookups = [os.path.join(work_dir, f"song-{rng.randrange(size)}", rng.choice(list(artifacts))) for _ in range(1000)]
+
+    def read():
+        for file_path in lookups:
+            with open(file_path, 'rb') as f:
+                f.read()
+    return read, len(lookups)
+
+
+def setup_syllabify_lines(size, work_dir):
+    lines = [line for line, _ in make_lyric_lines(size)]
+    return (lambda: syllables.syllabify_lines(lines)), size
+
+
+def setup_aligned_melody(size, work_dir):
+    song_lyrics = make_lyric_lines(size)
+    return (lambda: melody.generate_aligned_melody(song_lyrics, melody.melody_map, seed=0)), size
+
+
+def make_song_notes(num_notes, rng):
+    """
+    Random notes on three tracks, about four per beat.
+    """
+    notes = np.zeros(num_notes, dtype=NOTE_DTYPE)
+    notes['start'] = np.sort(rng.integers(0, num_notes * 120, num_notes))
+    notes['duration'] = rng.choice([120, 240, 480, 960], num_notes)
+    notes['note'] = rng.integers(36, 96, num_notes)
+    notes['velocity'] = 64
+    return notes, rng.integers(0, 3, num_notes)
+
+
+def setup_piano_roll_thumbnail(size, work_dir):
+    notes, tracks = make_song_notes(size, np.random.default_rng(size))
+    return (lambda: piano_roll.encode_png(piano_roll.render_thumbnail(notes, tracks, DEFAULT_TEMPO_MAP))), 1
+
+
+def setup_piano_roll_full(size, work_dir):
+    notes, tracks = make_song_notes(size, np.random.default_rng(size))
+
+    def render():
+        for tile in piano_roll.render_tiles(notes, tracks, DEFAULT_TEMPO_MAP):
+            piano_roll.encode_png(tile)
+    return render, size
+
+
+BENCHMARKS = {
+    "chords.generate_section": (setup_generate_section, [4, 64, 1024]),
+    "chords.generate_section_wide": (setup_generate_section_wide, [16, 128, 512]),
+    "chords.set_transition": (setup_set_transition, [16, 128, 512]),
+    "chords.create_multi_section_midi": (setup_create_multi_section_midi, [4, 32, 256]),
+    "lyrics.create_lyrics_graph": (setup_create_lyrics_graph, [20, 200, 1000]),
+    "lyrics.generate_lyrics": (setup_generate_lyrics, [20, 200, 1000]),
+    "melody.generate_melody_pattern_with_recording": (setup_generate_melody, [24, 240, 2400]),
+    "melody.create_midi_file": (setup_melody_midi, [24, 240, 2400]),
+    "melody.generate_aligned_melody": (setup_aligned_melody, [24, 240, 2400]),
+    "syllables.syllabify_lines": (setup_syllabify_lines, [24, 2400, 240000]),
+    "drum.generate_drum_pattern": (setup_generate_drums, [24, 240, 2400]),
+    "drum.create_midi_file": (setup_drum_midi, [24, 240, 2400]),
+    "merge_tracks.merge_midi_files": (setup_merge, [500, 2000, 8000]),
+    "archive.write": (setup_archive_write, [1, 10, 100]),
+    "archive.open_append": (setup_archive_open_append, [1000, 10000, 100000]),
+    "files.write": (setup_files_write, [1, 10, 100]),
+    "archive.read": (setup_archive_read, [10, 100, 1000]),
+    "files.read": (setup_files_read, [10, 100, 1000]),
+    "piano_roll.thumbnail": (setup_piano_roll_thumbnail, [300, 3000, 30000]),
+    "piano_roll.full": (setup_piano_roll_full, [300, 3000, 30000]),
+    "groove.apply_groove": (setup_groove, [10_000, 100_000, 1_000_000]),
+    "groove.groove_track": (setup_groove_track, [500, 2000, 8000]),
+}
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(func, items, repeat, min_seconds):
+    """
+    Time `func` at least `repeat` times (and for at least `min_seconds`), then measure its peak memory.
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput in items per second and peak bytes.
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        func()  # Warm-up
+
+        latencies = []
+        started = time.perf_counter()
+        while len(latencies) < repeat or time.perf_counter() - started < min_seconds:
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    return {
+        "items": items,
+        "runs": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p90_ms": percentile(latencies, 0.90) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "throughput_per_s": items / mean if mean > 0 else float("inf"),
+        "peak_bytes": peak,
+    }
+
+
+def run_benchmarks(names=None, quick=False, repeat=5, min_seconds=0.2, seed=0):
+    """
+    Run the selected benchmarks over their input sizes.
+
+    Args:
+        names (list): Benchmark names to run (all when None).
+        quick (bool): Only run the smallest input size of each benchmark.
+        repeat (int): Minimum number of timed runs per size.
+        min_seconds (float): Minimum time spent timing each size.
+        seed (int): Seed for the random module, so runs are comparable.
+
+    Returns:
+        dict: Results keyed by benchmark name, then input size.
+    """
+    results = {}
+    for name, (setup, sizes) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = {}
+        for size in sizes[:1] if quick else sizes:
+            random.seed(seed)
+            work_dir = tempfile.mkdtemp(prefix="graphmusic_bench_")
+            try:
+                with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                    func, items = setup(size, work_dir)
+                results[name][str(size)] = measure(func, items, repeat, min_seconds)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            row = results[name][str(size)]
+            print(f"{name:<48} size={size:<6} p50={row['p50_ms']:9.3f} ms  "
+                  f"p99={row['p99_ms']:9.3f} ms  {row['throughput_per_s']:12.0f} items/s  "
+                  f"peak={row['peak_bytes'] / 1024:9.1f} KiB")
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results against a stored baseline.
+
+    Returns:
+        list: Regression descriptions (empty when nothing regressed).
+    """
+    regressions = []
+    for name, sizes in results.items():
+        for size, row in sizes.items():
+            base = baseline.get("results", {}).get(name, {}).get(size)
+            if base is None:
+                continue
+            for metric in ("p50_ms", "peak_bytes"):
+                if row[metric] - base[metric] < MIN_DELTAS[metric]:
+                    continue
+                if base[metric] > 0 and row[metric] > base[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{name} size={size}: {metric} {row[metric]:.3f} vs baseline {base[metric]:.3f} "
+                        f"(+{(row[metric] / base[metric] - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GraphMusic generators and merge path.")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run (default: all).")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest input size.")
+    parser.add_argument("--repeat", type=int, default=5, help="Minimum timed runs per input size.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"Store the results as the baseline (--baseline, default '{DEFAULT_BASELINE}').")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative slowdown or memory growth before flagging a regression.")
+    parser.add_argument("--list", action="store_true", help="List the available benchmarks.")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, sizes) in BENCHMARKS.items():
+            print(f"{name}: sizes {sizes}")
+        return 0
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results = run_benchmarks(args.names, quick=args.quick, repeat=args.repeat)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Benchmark results saved as '{args.output}'")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved as '{args.baseline}'")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against '{args.baseline}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import os
+import json
+import argparse
+from itertools import islice
+from multiprocessing import Pool
+from mido import MidiFile
+from Chords import ChordProgressionGenerator
+from ngram import MAX_ORDER, count_ngrams
+from profiling import get_logger, stage, profiled_run
+
+logger = get_logger("corpus")
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+DRUM_CHANNEL = 9
+
+# Krumhansl-Kessler key profiles, starting from the tonic
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+# Pitch class of the tonic of each generator key; files are transposed onto these
+MODEL_TONICS = {'C': 0, 'Am': 9}
+
+# Templates of the worker processes, set by _init_worker
+_templates = None
+
+
+def chord_templates(generator):
+    """
+    Build the pitch-class templates of every chord numeral the generator knows.
+
+    Returns:
+        dict: {key: [(numeral, frozenset of pitch classes), ...]}
+    """
+    return {
+        key: [
+            (numeral, frozenset(generator.note_to_midi[note] % 12 for note in notes))
+            for numeral, notes in chords.items()
+        ]
+        for key, chords in generator.keys.items()
+    }
+
+
+def iter_midi_files(folder):
+    """
+    Yield the MIDI files below `folder` in a stable order, without listing the whole corpus up front.
+    """
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(MIDI_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def read_notes(path):
+    """
+    Read the pitched notes of a MIDI file.
+
+    Returns:
+        list: (start_beat, end_beat, midi_note) tuples, drums excluded.
+    """
+    midi = MidiFile(path)
+    ticks_per_beat = midi.ticks_per_beat
+    notes = []
+    for track in midi.tracks:
+        tick = 0
+        sounding = {}
+        for msg in track:
+            tick += msg.time
+            if msg.type not in ('note_on', 'note_off') or msg.channel == DRUM_CHANNEL:
+                continue
+            key = (msg.channel, msg.note)
+            if msg.type == 'note_on' and msg.velocity > 0:
+                sounding.setdefault(key, tick)
+            elif key in sounding:
+                start = sounding.pop(key)
+                if tick > start:
+                    notes.append((start / ticks_per_beat, tick / ticks_per_beat, msg.note))
+    return notes
+
+
+def estimate_key(notes):
+    """
+    Estimate the key of a piece by correlating its pitch-class durations with the key profiles.
+
+    Returns:
+        tuple: (generator key, semitone shift that transposes the piece onto that key)
+    """
+    histogram = [0.0] * 12
+    for start, end, note in notes:
+        histogram[note % 12] += end - start
+
+    def correlation(profile, tonic):
+        rotated = [profile[(pc - tonic) % 12] for pc in range(12)]
+        mean_h = sum(histogram) / 12
+        mean_p = sum(rotated) / 12
+        cov = sum((h - mean_h) * (p - mean_p) for h, p in zip(histogram, rotated))
+        var_h = sum((h - mean_h) ** 2 for h in histogram)
+        var_p = sum((p - mean_p) ** 2 for p in rotated)
+        return cov / (var_h * var_p) ** 0.5 if var_h and var_p else 0.0
+
+    candidates = [(correlation(MAJOR_PROFILE, t), 'C', t) for t in range(12)]
+    candidates += [(correlation(MINOR_PROFILE, t), 'Am', t) for t in range(12)]
+    _, key, tonic = max(candidates)
+    return key, (MODEL_TONICS[key] - tonic) % 12
+
+
+def detect_progression(notes, key, shift, templates):
+    """
+    Detect one chord per beat and return the progression as roman numerals, with held chords collapsed.
+    """
+    if not notes:
+        return []
+    num_beats = int(max(end for _, end, _ in notes)) + 1
+    beats = [[0.0] * 12 for _ in range(num_beats)]
+    for start, end, note in notes:
+        pc = (note + shift) % 12
+        for beat in range(int(start), min(num_beats, int(end) + 1)):
+            overlap = min(end, beat + 1) - max(start, beat)
+            if overlap > 0:
+                beats[beat][pc] += overlap
+
+    progression = []
+    for weights in beats:
+        best, best_score = None, 0.0
+        for numeral, pcs in templates[key]:
+            matched = sum(1 for pc in pcs if weights[pc] > 0)
+            if matched < 2:
+                continue
+            score = sum(weights[pc] for pc in pcs) - 0.5 * sum(w for pc, w in enumerate(weights) if pc not in pcs)
+            if score > best_score:
+                best, best_score = numeral, score
+        if best is not None and (not progression or progression[-1] != best):
+            progression.append(best)
+    return progression
+
+
+def _init_worker(templates):
+    global _templates
+    _templates = templates
+
+
+def analyze_file(path):
+    """
+    Worker task: detect the key and chord progression of one MIDI file.
+
+    Returns:
+        tuple: (generator key, progression), or None when the file cannot be read.
+    """
+    try:
+        notes = read_notes(path)
+    except Exception as e:
+        logger.warning("Skipping '%s': %r", path, e)
+        return None
+    if not notes:
+        return None
+    key, shift = estimate_key(notes)
+    return key, detect_progression(notes, key, shift, _templates)
+
+
+def empty_counts(templates):
+    """
+    Create a zeroed transition count matrix for each key.
+    """
+    return {key: [[0] * len(chords) for _ in chords] for key, chords in templates.items()}
+
+
+def accumulate(state, templates, key, progression):
+    """
+    Add the chord transitions of one progression to the count matrices, and its
+    n-grams (contexts of up to MAX_ORDER chords) to the n-gram counts.
+    """
+    index = {numeral: i for i, (numeral, _) in enumerate(templates[key])}
+    matrix = state["counts"][key]
+    for current, next_chord in zip(progression, progression[1:]):
+        matrix[index[current]][index[next_chord]] += 1
+    count_ngrams([progression], MAX_ORDER, state["ngrams"].setdefault(key, {}))
+
+
+def load_checkpoint(checkpoint_path, corpus_folder, templates):
+    """
+    Load the checkpoint of an interrupted ingestion of the same corpus, or start a new one.
+    """
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            state = json.load(f)
+        if state.get("corpus") == os.path.abspath(corpus_folder):
+            print(f"Resuming after {state['processed']} files from '{checkpoint_path}'")
+            return state
+        print(f"Checkpoint '{checkpoint_path}' belongs to another corpus, starting over")
+    return {
+        "corpus": os.path.abspath(corpus_folder),
+        "processed": 0,
+        "failed": 0,
+        "numerals": {key: [numeral for numeral, _ in chords] for key, chords in templates.items()},
+        "counts": empty_counts(templates),
+        "ngrams": {key: {} for key in templates},
+    }
+
+
+def save_checkpoint(state, checkpoint_path):
+    """
+    Atomically replace the checkpoint, so a crash never leaves a half-written file.
+    """
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def normalized_model(state):
+    """
+    Turn the transition counts into outgoing edge probabilities per chord.
+
+    Returns:
+        dict: {key: {chord: {next_chord: probability}}}
+    """
+    model = {}
+    for key, matrix in state["counts"].items():
+        numerals = state["numerals"][key]
+        model[key] = {}
+        for i, row in enumerate(matrix):
+            total = sum(row)
+            if total:
+                model[key][numerals[i]] = {
+                    numerals[j]: count / total for j, count in enumerate(row) if count
+                }
+    return model
+
+
+def ingest_corpus(corpus_folder, output_path, checkpoint_path=None, workers=None, batch_size=512):
+    """
+    Learn chord transition weights from a folder of MIDI files.
+    Files are streamed through a process pool one batch at a time, so memory stays bounded by the
+    batch size, and the counts are checkpointed after every batch so an interrupted run can resume.
+
+    Args:
+        corpus_folder (str): Folder searched recursively for .mid/.midi files.
+        output_path (str): Where to write the normalized chord model (JSON).
+        checkpoint_path (str): Checkpoint file (defaults to '<output_path>.checkpoint').
+        workers (int): Number of worker processes (defaults to the CPU count).
+        batch_size (int): Files handed to the pool between checkpoints.
+
+    Returns:
+        dict: The normalized model that was written.
+    """
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    templates = chord_templates(ChordProgressionGenerator())
+    state = load_checkpoint(checkpoint_path, corpus_folder, templates)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    paths = islice(iter_midi_files(corpus_folder), state["processed"], None)
+    with Pool(workers, initializer=_init_worker, initargs=(templates,)) as pool:
+        while True:
+            batch = list(islice(paths, batch_size))
+            if not batch:
+                break
+            with stage("ingest batch", files=len(batch)):
+                chunksize = max(1, len(batch) // (4 * (workers or os.cpu_count() or 1)))
+                for result in pool.imap(analyze_file, batch, chunksize=chunksize):
+                    if result is None:
+                        state["failed"] += 1
+                    else:
+                        accumulate(state, templates, *result)
+            state["processed"] += len(batch)
+            save_checkpoint(state, checkpoint_path)
+            print(f"Processed {state['processed']} files ({state['failed']} skipped)")
+
+    model = normalized_model(state)
+    with open(output_path, "w") as f:
+        json.dump({
+            "files": state["processed"] - state["failed"],
+            "model": model,
+            "ngrams": state["ngrams"],
+        }, f, indent=2)
+    os.remove(checkpoint_path)
+    print(f"Chord model saved as '{output_path}'")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn chord transition weights from a MIDI corpus.")
+    parser.add_argument("corpus", help="Folder containing MIDI files (searched recursively).")
+    parser.add_argument("--output", default=os.path.join("createdFiles", "chord_model.json"),
+                        help="Output model file.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file used to resume an interrupted run.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--batch-size", type=int, default=512, help="Files processed between checkpoints.")
+    args = parser.parse_args()
+
+    ingest_corpus(args.corpus, args.output, args.checkpoint, args.workers, args.batch_size)
+
+
+if __name__ == "__main__":
+    with profiled_run("corpus"):
+        main()
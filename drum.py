@@ -4,6 +4,11 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import random
 import pygame
+import numpy as np
+import syllables
+from melody import LYRICS_PATH, read_song_lyrics
+from profiling import stage, profiled_run
+from timebase import PPQ, DEFAULT_TEMPO_MAP, NOTE_DTYPE, notes_to_track
 
 # Ensure the directory for saving files exists
 SAVE_DIR = "createdFiles"
@@ -23,9 +28,19 @@ EDGE_WIDTH = 2
 DEFAULT_NODE_COLOR = "orange"
 NODE_SIZE = 2000
 
-def generate_drum_pattern(lyrics):
+def generate_drum_pattern(lyrics, rng=random):
     """
     Generate a semi-random drum pattern based on lyrical structure
+    Pass a seeded random.Random as `rng` for reproducible patterns.
+    """
+    return [drum for line_drums in generate_line_drums(lyrics, rng) for drum in line_drums]
+
+def generate_line_drums(lyrics, rng=random):
+    """
+    Pick the 2-3 drums of every lyric line.
+
+    Returns:
+        list: One list of drum names per line.
     """
     drum_mapping = {
         'Verse 1': ['Bass', 'Snare', 'Hi-Hat', 'Tom'],
@@ -34,26 +49,49 @@ def generate_drum_pattern(lyrics):
         'Bridge': ['Bass', 'Snare', 'Cymbal', 'Clap']
     }
     
-    drum_sequence = []
-    current_section = None
-    
+    line_drums = []
     for line, section in lyrics:
-        if section != current_section:
-            current_section = section
-        
         # Choose 2-3 drum notes for each line
-        line_drums = random.choices(drum_mapping.get(section, ['Bass', 'Snare']), k=random.randint(2, 3))
-        drum_sequence.extend(line_drums)
-    
-    return drum_sequence
+        line_drums.append(rng.choices(drum_mapping.get(section, ['Bass', 'Snare']), k=rng.randint(2, 3)))
+    return line_drums
+
+def aligned_drum_notes(line_drums, line_starts, line_lengths, ppq=PPQ):
+    """
+    Lay the drums of every line on the lyric bar grid (see syllables.line_layout): one hit per
+    beat from the start of the line to its end, cycling through the line's drums.
+
+    Args:
+        line_drums (list): Drum names per line, from `generate_line_drums`.
+        line_starts (array): Start tick of every line.
+        line_lengths (array): Length of every line in ticks.
+        ppq (int): Ticks per beat.
 
-def create_midi_file(drum_sequence):
+    Returns:
+        np.ndarray: NOTE_DTYPE array on channel 10.
+    """
+    beats = np.asarray(line_lengths, dtype=np.int64) // ppq
+    lines = np.repeat(np.arange(len(beats)), beats)
+    beat_in_line = np.arange(len(lines)) - np.repeat(np.cumsum(beats) - beats, beats)
+    sizes = np.array([len(drums) for drums in line_drums], dtype=np.int64)
+    first = np.cumsum(sizes) - sizes
+    pool = np.array([DRUM_NOTES[drum] for drums in line_drums for drum in drums], dtype=np.int64)
+
+    notes = np.empty(len(lines), dtype=NOTE_DTYPE)
+    notes['start'] = np.asarray(line_starts, dtype=np.int64)[lines] + beat_in_line * ppq
+    notes['duration'] = ppq
+    notes['channel'] = 9
+    notes['note'] = pool[first[lines] + beat_in_line % sizes[lines]]
+    notes['velocity'] = 64
+    return notes
+
+def create_midi_file(drum_sequence, folder_name=SAVE_DIR, filename='drum_pattern.mid', tempo_map=DEFAULT_TEMPO_MAP):
     """
     Create a MIDI file with the generated drum sequence
     """
-    mid = MidiFile()
+    mid = MidiFile(ticks_per_beat=PPQ)
     track = MidiTrack()
     mid.tracks.append(track)
+    track.extend(tempo_map.header_messages())
     
     # Add drum track
     for note_name in drum_sequence:
@@ -61,14 +99,25 @@ def create_midi_file(drum_sequence):
         
         # Note on
         track.append(Message('note_on', note=note, velocity=64, time=0, channel=9))
-        # Note off (after 480 ticks, which is one beat)
-        track.append(Message('note_off', note=note, velocity=64, time=480, channel=9))
+        # Note off (after one beat)
+        track.append(Message('note_off', note=note, velocity=64, time=PPQ, channel=9))
     
     # Save MIDI file in the createdFiles directory
-    midi_path = os.path.join(SAVE_DIR, 'drum_pattern.mid')
+    os.makedirs(folder_name, exist_ok=True)
+    midi_path = os.path.join(folder_name, filename)
     mid.save(midi_path)
     return mid
 
+def create_aligned_midi_file(notes, folder_name=SAVE_DIR, filename='drum_pattern.mid', tempo_map=DEFAULT_TEMPO_MAP):
+    """
+    Create a MIDI file with drums laid out by `aligned_drum_notes`
+    """
+    mid = MidiFile(ticks_per_beat=tempo_map.ppq)
+    mid.tracks.append(notes_to_track(notes, tempo_map.meta_messages()))
+    os.makedirs(folder_name, exist_ok=True)
+    mid.save(os.path.join(folder_name, filename))
+    return mid
+
 def play_midi_pygame(midi_file):
     """
     Play MIDI file using pygame
@@ -187,15 +236,36 @@ lyrics = [
     ("CS 5002 leads the way", "Chorus"),
 ]
 
-# Generate drum sequence and MIDI
-full_drum_sequence = generate_drum_pattern(lyrics)
-midi_file = create_midi_file(full_drum_sequence)
+def main():
+    # Follow the bars of the lyric-aligned melody when lyrics.py has written the lyrics
+    aligned = os.path.exists(LYRICS_PATH)
+
+    # Generate drum sequence and MIDI
+    with stage("sampling", aligned=aligned):
+        if aligned:
+            song_lyrics = read_song_lyrics()
+            batch = syllables.syllabify_lines([line for line, _ in song_lyrics])
+            line_starts, line_lengths = syllables.line_layout(batch)
+            drum_notes = aligned_drum_notes(generate_line_drums(song_lyrics), line_starts, line_lengths)
+        else:
+            full_drum_sequence = generate_drum_pattern(lyrics)
+    with stage("MIDI encode"):
+        if aligned:
+            midi_file = create_aligned_midi_file(drum_notes)
+        else:
+            midi_file = create_midi_file(full_drum_sequence)
+
+    # Create comprehensive graph with section highlights
+    with stage("render"):
+        comprehensive_graph = create_comprehensive_drum_transition_graph(lyrics)
 
-# Create comprehensive graph with section highlights
-comprehensive_graph = create_comprehensive_drum_transition_graph(lyrics)
+    # Play the MIDI file
+    print("Attempting to play the MIDI file...")
+    with stage("playback"):
+        play_midi_pygame(midi_file)
 
-# Play the MIDI file
-print("Attempting to play the MIDI file...")
-play_midi_pygame(midi_file)
+    print("MIDI file 'drum_pattern.mid' has been created.")
 
-print("MIDI file 'drum_pattern.mid' has been created.")
\ No newline at end of file
+if __name__ == "__main__":
+    with profiled_run("drum"):
+        main()
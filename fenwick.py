@@ -0,0 +1,153 @@
+import random
+
+# Failed draws (rounding landing on an empty slot) before the tree is recomputed from the weights
+MAX_RETRIES = 8
+
+
+class WeightedSampler:
+    """
+    Weighted random choice over a changing set of items, backed by a Fenwick (binary indexed) tree
+    of the weights. Setting, adding or removing an item and drawing one all cost O(log n), so
+    weights can be edited between draws without rebuilding any table.
+    """
+
+    def __init__(self, weights=None):
+        """
+        Args:
+            weights (dict): Initial item -> weight.
+        """
+        weights = dict(weights or {})
+        self._rebuild(list(weights.items()), max(len(weights), 1))
+
+    def _rebuild(self, pairs, capacity):
+        self.items = [item for item, _ in pairs] + [None] * (capacity - len(pairs))
+        self.weights = [float(weight) for _, weight in pairs] + [0.0] * (capacity - len(pairs))
+        self.slots = {item: slot for slot, item in enumerate(self.items) if item is not None}
+        self.free = list(range(capacity - 1, len(pairs) - 1, -1))
+        self.positive = sum(1 for weight in self.weights if weight > 0)
+        self._rebuild_tree()
+        self.top = 1 << (capacity.bit_length() - 1)
+
+    def _rebuild_tree(self):
+        """
+        Recompute the tree from the weights in O(n), dropping the rounding error that
+        the float deltas of earlier edits left in the partial sums.
+        """
+        capacity = len(self.weights)
+        # tree[i] holds the sum of weights[i - lowbit(i) .. i - 1] (1-based)
+        self.tree = [0.0] + self.weights
+        for i in range(1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                self.tree[parent] += self.tree[i]
+
+    def _update(self, slot, delta):
+        i = slot + 1
+        capacity = len(self.weights)
+        while i <= capacity:
+            self.tree[i] += delta
+            i += i & -i
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, item):
+        return item in self.slots
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def weight(self, item):
+        return self.weights[self.slots[item]]
+
+    @property
+    def total(self):
+        total = 0.0
+        i = len(self.weights)
+        while i:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def set(self, item, weight):
+        """
+        Set the weight of an item, adding the item when it is new.
+        """
+        if weight < 0:
+            raise ValueError(f"Weights cannot be negative, got {weight}")
+        slot = self.slots.get(item)
+        if slot is None:
+            if not self.free:
+                # Double the capacity; the O(n) rebuild is amortized over the next n additions
+                pairs = [(other, self.weights[s]) for other, s in self.slots.items()]
+                self._rebuild(pairs, 2 * len(self.weights))
+            slot = self.free.pop()
+            self.items[slot] = item
+            self.slots[item] = slot
+        delta = weight - self.weights[slot]
+        self.positive += (weight > 0) - (self.weights[slot] > 0)
+        self.weights[slot] = float(weight)
+        self._apply(slot, delta)
+
+    def remove(self, item):
+        """
+        Remove an item; its slot is reused by the next new item.
+        """
+        slot = self.slots.pop(item)
+        delta = -self.weights[slot]
+        self.positive -= self.weights[slot] > 0
+        self.weights[slot] = 0.0
+        self.items[slot] = None
+        self.free.append(slot)
+        self._apply(slot, delta)
+
+    def _apply(self, slot, delta):
+        """
+        Add a weight change to the tree. A decrease larger than what is left of the total would
+        leave mostly rounding error in the partial sums (1e20 + 1 - 1e20 is 0), so the tree is
+        recomputed instead.
+        """
+        self._update(slot, delta)
+        if delta < 0 and -delta > self.total:
+            self._rebuild_tree()
+
+    def sample(self, rng=random):
+        """
+        Draw an item with probability proportional to its weight.
+
+        Returns:
+            The drawn item, or None when no item has a positive weight.
+        """
+        if not self.positive:
+            return None
+        total = self.total
+        if total <= 0:
+            self._rebuild_tree()
+            total = self.total
+        for attempt in range(2 * MAX_RETRIES):
+            if attempt == MAX_RETRIES:
+                self._rebuild_tree()
+                total = self.total
+            remaining = rng.random() * total
+            # Descend the tree to the first slot whose prefix sum exceeds the target
+            position = 0
+            step = self.top
+            while step:
+                next_position = position + step
+                if next_position < len(self.tree) and self.tree[next_position] <= remaining:
+                    position = next_position
+                    remaining -= self.tree[position]
+                step >>= 1
+            # Rounding can leave the target on an emptied or past-the-end slot; draw again
+            # (after MAX_RETRIES misses, from a recomputed tree)
+            if position < len(self.weights) and self.weights[position] > 0:
+                return self.items[position]
+        # Weights too far apart for the float partial sums to tell apart; draw by scanning them
+        target = rng.random() * sum(self.weights)
+        for item, weight in zip(self.items, self.weights):
+            if weight > 0:
+                last = item
+                target -= weight
+                if target < 0:
+                    return item
+        return last
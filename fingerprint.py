@@ -0,0 +1,223 @@
+import os
+import struct
+import random
+import sqlite3
+import hashlib
+import argparse
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16  # NUM_PERM / BANDS rows per band; pairs above ~0.5 similarity usually share a bucket
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Fixed permutations, so signatures stay comparable across runs and machines
+_rng = random.Random(5002)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+# The multipliers split into 29 high and 32 low bits, so every partial product fits in 64 bits
+_A_HIGH = np.array([a >> 32 for a, _ in PERMUTATIONS], dtype=np.uint64)
+_A_LOW = np.array([a & MAX_HASH for a, _ in PERMUTATIONS], dtype=np.uint64)
+_B = np.array([b for _, b in PERMUTATIONS], dtype=np.uint64)
+_PRIME = np.uint64(MERSENNE_PRIME)
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=4).digest(), 'little')
+
+
+def _ngrams(prefix, items, n):
+    items = [str(item) for item in items]
+    if len(items) < n:
+        return {f"{prefix}:{'>'.join(items)}"} if items else set()
+    return {f"{prefix}:{'>'.join(items[i:i + n])}" for i in range(len(items) - n + 1)}
+
+
+def song_shingles(chords=None, melody=None, drums=None, n=SHINGLE_SIZE):
+    """
+    Build the shingle set of a song from any of its parts.
+
+    Args:
+        chords (list): Chord numerals of the whole song, in order.
+        melody (list): MIDI note numbers of the melody; hashed as intervals, so transpositions match.
+        drums (list): Drum names (or notes) of the drum pattern.
+        n (int): Shingle length.
+
+    Returns:
+        set: Shingle strings, prefixed by the part they come from.
+    """
+    shingles = set()
+    if chords:
+        shingles |= _ngrams("chord", chords, n)
+    if melody:
+        intervals = [f"{b - a:+d}" for a, b in zip(melody, melody[1:])]
+        shingles |= _ngrams("melody", intervals, n)
+    if drums:
+        shingles |= _ngrams("drum", drums, n)
+    return shingles
+
+
+def _fold(x):
+    """
+    Partly reduce uint64 values modulo the Mersenne prime 2**61 - 1 (result below 2**61 + 8).
+    """
+    return (x & _PRIME) + (x >> np.uint64(61))
+
+
+def minhash(shingles):
+    """
+    Compute the MinHash signature of a shingle set.
+    All (a * h + b) % MERSENNE_PRIME values are computed in one shingles x permutations array,
+    exactly, so signatures match the ones computed with Python integers.
+
+    Returns:
+        tuple: NUM_PERM integers.
+    """
+    hashes = np.array([_hash(shingle) for shingle in shingles] or [0], dtype=np.uint64)[:, None]
+    # a * h = (high * h) * 2**32 + low * h, and 2**61 is 1 modulo the prime
+    high = _A_HIGH * hashes
+    high = (high >> np.uint64(29)) + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+    values = _fold(high + _fold(_A_LOW * hashes) + _B)
+    values = np.where(values >= _PRIME, values - _PRIME, values)
+    return tuple((values.min(axis=0) & np.uint64(MAX_HASH)).tolist())
+
+
+def similarity(signature_a, signature_b):
+    """
+    Estimate the Jaccard similarity of two songs from their signatures.
+    """
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+
+class SongIndex:
+    """
+    On-disk LSH index of song signatures, stored in SQLite.
+    Each signature is split into BANDS bands; songs sharing any band bucket are candidates,
+    and only candidates are compared, so a lookup does not depend on the catalog size.
+    """
+
+    def __init__(self, path, bands=BANDS):
+        if NUM_PERM % bands:
+            raise ValueError(f"bands must divide {NUM_PERM}, got {bands}")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS songs (song_id TEXT PRIMARY KEY, signature BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (bucket INTEGER, song_id TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (bucket)")
+        # Lets add() replace a song's buckets without scanning the whole table
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_song ON buckets (song_id)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    def _buckets(self, signature):
+        # The band number is hashed in, so one indexed column covers every band
+        buckets = []
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(struct.pack(f"<H{self.rows}I", band, *values), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, 'little', signed=True))
+        return buckets
+
+    def add(self, song_id, signature, commit=True):
+        """
+        Add a song signature to the index, replacing the song if it is already there.
+        """
+        self.conn.execute("DELETE FROM buckets WHERE song_id = ?", (song_id,))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO songs VALUES (?, ?)",
+            (song_id, struct.pack(f"<{NUM_PERM}I", *signature)),
+        )
+        self.conn.executemany(
+            "INSERT INTO buckets VALUES (?, ?)",
+            [(bucket, song_id) for bucket in self._buckets(signature)],
+        )
+        if commit:
+            self.conn.commit()
+
+    def query(self, signature, threshold=DEFAULT_THRESHOLD):
+        """
+        Find indexed songs whose estimated similarity is at least `threshold`.
+
+        Returns:
+            list: (song_id, similarity) pairs, most similar first.
+        """
+        buckets = self._buckets(signature)
+        placeholders = ", ".join("?" for _ in buckets)
+        rows = self.conn.execute(
+            f"SELECT song_id, signature FROM songs WHERE song_id IN "
+            f"(SELECT song_id FROM buckets WHERE bucket IN ({placeholders}))",
+            buckets,
+        ).fetchall()
+
+        matches = []
+        for song_id, blob in rows:
+            score = similarity(signature, struct.unpack(f"<{NUM_PERM}I", blob))
+            if score >= threshold:
+                matches.append((song_id, score))
+        return sorted(matches, key=lambda match: -match[1])
+
+
+def generate_unique(generate, shingles, index, song_id, threshold=DEFAULT_THRESHOLD, max_attempts=10):
+    """
+    Generate a song that is not a near-duplicate of anything in the index, then add it.
+
+    Args:
+        generate (callable): Returns a new song on every call.
+        shingles (callable): Turns a song into its shingle set (see song_shingles).
+        index (SongIndex): Catalog of songs already shipped.
+        song_id (str): Id under which the accepted song is indexed.
+        threshold (float): Songs at least this similar to an indexed song are regenerated.
+        max_attempts (int): Give up after this many attempts and keep the least similar song.
+
+    Returns:
+        tuple: (song, highest similarity to an indexed song)
+    """
+    best = None
+    for attempt in range(max_attempts):
+        song = generate()
+        signature = minhash(shingles(song))
+        matches = index.query(signature, threshold)
+        score = matches[0][1] if matches else 0.0
+        if best is None or score < best[2]:
+            best = (song, signature, score)
+        if not matches:
+            break
+        print(f"Attempt {attempt + 1}: {score:.0%} similar to '{matches[0][0]}', regenerating")
+    else:
+        print(f"No song below {threshold:.0%} similarity after {max_attempts} attempts; keeping the least similar")
+
+    song, signature, score = best
+    index.add(song_id, signature)
+    return song, score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a song fingerprint index.")
+    parser.add_argument("index", help="SQLite index file.")
+    args = parser.parse_args()
+
+    with SongIndex(args.index) as index:
+        print(f"'{args.index}' holds {len(index)} songs")
+
+
+if __name__ == "__main__":
+    main()
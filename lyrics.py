@@ -3,6 +3,8 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import random
 from itertools import cycle
+from collections import Counter
+from profiling import stage, profiled_run
 
 # Define rhyme groups and their phrases (graph theory themes)
 rhyme_groups = {
@@ -13,6 +15,17 @@ rhyme_groups = {
     "E": ["Spanning free, matchings decree", "CS 5002 builds unity", "Graphs agree, complexity foresee", "Dr. Amjad inspires me"]
 }
 
+# Pick k distinct items satisfying `keep` by rejection sampling; callers make sure
+# at least k distinct items and half of the population qualify, so this stays O(k)
+# on large corpora and always returns
+def sample_where(population, k, keep):
+    picked = {}
+    while len(picked) < k:
+        item = random.choice(population)
+        if keep(item):
+            picked[item] = None
+    return list(picked)
+
 # Create a graph with rhyme groups
 def create_lyrics_graph(rhyme_groups):
     G = nx.DiGraph()
@@ -21,18 +34,35 @@ def create_lyrics_graph(rhyme_groups):
     for group, phrases in rhyme_groups.items():
         for phrase in phrases:
             G.add_node(phrase, rhyme_group=group)
+    all_phrases = list(G.nodes)
+    # Distinct phrases per group (a repeated phrase is one node, in the last group listing it)
+    group_sizes = Counter(group for _, group in G.nodes(data="rhyme_group"))
 
     # Add directed edges based on rhyme group transitions
     for group, phrases in rhyme_groups.items():
+        phrases = list(dict.fromkeys(phrases))
+        num_other = len(all_phrases) - group_sizes[group]
+        # List the other groups' phrases when they are too few to sample by rejection
+        other_groups = None
+        if num_other <= 3 or 2 * num_other < len(all_phrases):
+            other_groups = [p for p in all_phrases if G.nodes[p]["rhyme_group"] != group]
+
         for phrase in phrases:
             # Connect to other phrases in the same rhyme group
-            same_group = [p for p in phrases if p != phrase]
-            for target in random.sample(same_group, min(2, len(same_group))):
+            if len(phrases) <= 4:
+                same_group = [p for p in phrases if p != phrase]
+                targets = random.sample(same_group, min(2, len(same_group)))
+            else:
+                targets = sample_where(phrases, 2, lambda p: p != phrase)
+            for target in targets:
                 G.add_edge(phrase, target)
 
             # Connect to random phrases in other groups for variety
-            other_groups = [p for g, ps in rhyme_groups.items() if g != group for p in ps]
-            for target in random.sample(other_groups, min(3, len(other_groups))):
+            if other_groups is not None:
+                targets = random.sample(other_groups, min(3, len(other_groups)))
+            else:
+                targets = sample_where(all_phrases, 3, lambda p: G.nodes[p]["rhyme_group"] != group)
+            for target in targets:
                 G.add_edge(phrase, target)
 
     return G
@@ -94,27 +124,29 @@ def visualize_lyrics_graph(graph, path, folder_name="createdFiles", filename="gr
     plt.close()
 
 # Main function
-if __name__ == "__main__":
+def main():
     # Create the graph
-    lyrics_graph = create_lyrics_graph(rhyme_groups)
+    with stage("graph build"):
+        lyrics_graph = create_lyrics_graph(rhyme_groups)
     print("Lyrical Graph created")
 
     # Define a rhyme scheme and generate lyrics
-    verse1 = "BBCC"
-    num_lines = 4
-    verse1_lyrics, verse1_path = generate_lyrics(lyrics_graph, verse1, num_lines)
+    with stage("sampling"):
+        verse1 = "BBCC"
+        num_lines = 4
+        verse1_lyrics, verse1_path = generate_lyrics(lyrics_graph, verse1, num_lines)
 
-    verse2 = "BBCC"
-    num_lines = 4
-    verse2_lyrics, verse2_path = generate_lyrics(lyrics_graph, verse2, num_lines)
+        verse2 = "BBCC"
+        num_lines = 4
+        verse2_lyrics, verse2_path = generate_lyrics(lyrics_graph, verse2, num_lines)
 
-    chorus = "AAAA"  # Example rhyme scheme
-    num_lines = 4
-    chorus_lyrics, chorus_path = generate_lyrics(lyrics_graph, chorus, num_lines)
+        chorus = "AAAA"  # Example rhyme scheme
+        num_lines = 4
+        chorus_lyrics, chorus_path = generate_lyrics(lyrics_graph, chorus, num_lines)
 
-    bridge = "DDEE"
-    num_lines = 4
-    bridge_lyrics, bridge_path = generate_lyrics(lyrics_graph, bridge, num_lines)
+        bridge = "DDEE"
+        num_lines = 4
+        bridge_lyrics, bridge_path = generate_lyrics(lyrics_graph, bridge, num_lines)
 
     # Ensure the createdFiles folder exists
     folder_name = "createdFiles"
@@ -139,7 +171,12 @@ if __name__ == "__main__":
     print(f"Lyrics written to '{file_path}'.")
 
     # Visualize the graph with the generated lyrics path and save to createdFiles
-    visualize_lyrics_graph(lyrics_graph, verse1_path, folder_name, "lyrics_verse1_graph.png")
-    visualize_lyrics_graph(lyrics_graph, chorus_path, folder_name, "lyrics_chorus_graph.png")
-    visualize_lyrics_graph(lyrics_graph, verse2_path, folder_name, "lyrics_verse2_graph.png")
-    visualize_lyrics_graph(lyrics_graph, bridge_path, folder_name, "lyrics_bridge_graph.png")
+    with stage("render"):
+        visualize_lyrics_graph(lyrics_graph, verse1_path, folder_name, "lyrics_verse1_graph.png")
+        visualize_lyrics_graph(lyrics_graph, chorus_path, folder_name, "lyrics_chorus_graph.png")
+        visualize_lyrics_graph(lyrics_graph, verse2_path, folder_name, "lyrics_verse2_graph.png")
+        visualize_lyrics_graph(lyrics_graph, bridge_path, folder_name, "lyrics_bridge_graph.png")
+
+if __name__ == "__main__":
+    with profiled_run("lyrics"):
+        main()
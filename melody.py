@@ -4,6 +4,15 @@ import pygame
 import networkx as nx
 import matplotlib.pyplot as plt
 import os
+import numpy as np
+import syllables
+from profiling import get_logger, stage, profiled_run
+from timebase import PPQ, DEFAULT_TEMPO_MAP, notes_to_track
+
+logger = get_logger("melody")
+
+# Lyrics written by lyrics.py; the melody follows their syllables when present
+LYRICS_PATH = os.path.join('createdFiles', 'lyrics.txt')
 
 # Define melody map
 melody_map = {
@@ -58,11 +67,11 @@ def midi_to_note_name(midi_note):
         note = NOTE_NAMES[midi_note % 12]
         return f"{note}{octave}"
 
-def generate_melody_pattern_with_recording(lyrics, melody_map):
+def generate_melody_pattern_with_recording(lyrics, melody_map, rng=random):
     """
     Generate a semi-random melody pattern based on lyrical structure and melody map.
     Logs the picked notes for each section in human-readable format (e.g., C4) and
-    records them for further use.
+    records them for further use. Pass a seeded random.Random as `rng` for reproducible melodies.
 
     Returns:
         tuple: The melody sequence and a dictionary of picked notes by section.
@@ -86,14 +95,14 @@ def generate_melody_pattern_with_recording(lyrics, melody_map):
         section_melody = melody_map.get(section, [])
         
         # Choose 2-4 notes for each line, preserving their articulation if specified
-        line_melody = random.choices(section_melody, k=random.randint(2, 4))
+        line_melody = rng.choices(section_melody, k=rng.randint(2, 4))
         melody_sequence.extend(line_melody)
 
         # Convert picked notes to human-readable names
         picked_notes = [midi_to_note_name(note["note"]) for note in line_melody]
 
         # Log and store the picked notes for the current section
-        print(f"Section '{section}', Line '{line}': Picked notes: {picked_notes}")
+        logger.debug("Section '%s', Line '%s': Picked notes: %s", section, line, picked_notes)
         if section not in section_picked_notes:
             section_picked_notes[section] = []
         section_picked_notes[section].extend(picked_notes)
@@ -102,6 +111,52 @@ def generate_melody_pattern_with_recording(lyrics, melody_map):
 
 
 
+def read_song_lyrics(file_path=LYRICS_PATH):
+    """
+    Read a lyrics file with "[Section]" headers, as written by lyrics.py.
+
+    Returns:
+        list: (line, section) pairs, in the format of `lyrics` below.
+    """
+    song_lyrics = []
+    section = None
+    with open(file_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1]
+            elif line:
+                song_lyrics.append((line, section))
+    return song_lyrics
+
+
+def generate_aligned_melody(lyrics, melody_map, seed=None, tempo_map=DEFAULT_TEMPO_MAP):
+    """
+    Generate a melody with one note per syllable of the lyrics (see syllables.align_notes):
+    stressed syllables fall on longer, louder notes and every line starts on a new bar.
+    Pitches come from the section's notes in the melody map.
+
+    Returns:
+        tuple: The notes (timebase.NOTE_DTYPE array), their MIDI lyric events and a
+        dictionary of picked notes by section.
+    """
+    sections = list(melody_map)
+    # Lines of a section missing from the melody map use the first section's notes
+    section_ids = np.array([sections.index(section) if section in melody_map else 0 for _, section in lyrics])
+    palettes = [[note["note"] for note in melody_map[section]] for section in sections]
+
+    batch = syllables.syllabify_lines([line for line, _ in lyrics])
+    notes = syllables.align_notes(batch, section_ids, palettes, tempo_map, seed)
+
+    note_names = np.array([midi_to_note_name(note) for note in range(128)])
+    syllable_sections = section_ids[syllables.line_index(batch)]
+    section_picked_notes = {
+        sections[i]: note_names[notes['note'][syllable_sections == i]].tolist()
+        for i in np.unique(syllable_sections).tolist()
+    }
+    return notes, syllables.lyric_messages(batch, notes), section_picked_notes
+
+
 def visualize_melody_graphs(picked_notes_by_section, melody_map, folder_name='createdFiles'):
     """
     Create and save graphs:
@@ -205,13 +260,14 @@ def visualize_melody_graphs(picked_notes_by_section, melody_map, folder_name='cr
     plt.close()
 
 
-def create_midi_file(melody_notes, folder_name='createdFiles', filename='melody.mid'):
+def create_midi_file(melody_notes, folder_name='createdFiles', filename='melody.mid', tempo_map=DEFAULT_TEMPO_MAP):
     """
     Save the melody to a MIDI file in the specified folder.
     Args:
-        melody_notes (list): A list of dictionaries for melody notes.
+        melody_notes (list): A list of dictionaries for melody notes (durations in ticks at timebase.PPQ).
         folder_name (str): The name of the folder to save the file in.
         filename (str): The name of the MIDI file.
+        tempo_map (TempoMap): Tempo and time signatures written at the start of the track.
     Returns:
         str: The full path of the saved MIDI file.
     """
@@ -220,9 +276,10 @@ def create_midi_file(melody_notes, folder_name='createdFiles', filename='melody.
     file_path = os.path.join(folder_name, filename)
 
     # Create a MIDI file
-    mid = MidiFile()
+    mid = MidiFile(ticks_per_beat=PPQ)
     melody_track = MidiTrack()
     mid.tracks.append(melody_track)
+    melody_track.extend(tempo_map.header_messages())
 
     for note_data in melody_notes:
         melody_track.append(Message('note_on', note=note_data["note"], velocity=note_data["velocity"], time=0))
@@ -234,6 +291,29 @@ def create_midi_file(melody_notes, folder_name='createdFiles', filename='melody.
     return file_path
 
 
+def create_aligned_midi_file(notes, lyric_events, folder_name='createdFiles', filename='melody.mid',
+                             tempo_map=DEFAULT_TEMPO_MAP):
+    """
+    Save an aligned melody with its syllables as MIDI lyric events, each just before its note.
+    Args:
+        notes (np.ndarray): Notes from `generate_aligned_melody`.
+        lyric_events (list): (tick, MetaMessage) lyric events from `generate_aligned_melody`.
+        folder_name (str): The name of the folder to save the file in.
+        filename (str): The name of the MIDI file.
+        tempo_map (TempoMap): Tempo and time signatures written at the start of the track.
+    Returns:
+        str: The full path of the saved MIDI file.
+    """
+    os.makedirs(folder_name, exist_ok=True)
+    file_path = os.path.join(folder_name, filename)
+
+    mid = MidiFile(ticks_per_beat=tempo_map.ppq)
+    mid.tracks.append(notes_to_track(notes, tempo_map.meta_messages() + lyric_events))
+    mid.save(file_path)
+    print(f"MIDI file saved as '{file_path}'")
+    return file_path
+
+
 def play_midi_pygame(file_path):
     """
     Play a MIDI file using pygame.
@@ -284,16 +364,35 @@ lyrics = [
 ]
 
 
-# Generate melody notes and record picked notes by section
-melody_notes, picked_notes_by_section = generate_melody_pattern_with_recording(lyrics, melody_map)
-
-# Visualize and save melody graphs
-visualize_melody_graphs(picked_notes_by_section, melody_map)
-
-# Combine melody and drum tracks into a MIDI file
-midi_file = create_midi_file(melody_notes)
-
-# Play the MIDI file
-print("Attempting to play the combined MIDI file...")
-play_midi_pygame(midi_file)
-print(f"Combined MIDI file '{midi_file}' has been created.")
+def main():
+    # Follow the syllables of the generated lyrics when lyrics.py has written them
+    aligned = os.path.exists(LYRICS_PATH)
+
+    # Generate melody notes and record picked notes by section
+    with stage("sampling", aligned=aligned):
+        if aligned:
+            melody_notes, lyric_events, picked_notes_by_section = generate_aligned_melody(
+                read_song_lyrics(), melody_map)
+        else:
+            melody_notes, picked_notes_by_section = generate_melody_pattern_with_recording(lyrics, melody_map)
+
+    # Visualize and save melody graphs
+    with stage("render"):
+        visualize_melody_graphs(picked_notes_by_section, melody_map)
+
+    # Combine melody and drum tracks into a MIDI file
+    with stage("MIDI encode"):
+        if aligned:
+            midi_file = create_aligned_midi_file(melody_notes, lyric_events)
+        else:
+            midi_file = create_midi_file(melody_notes)
+
+    # Play the MIDI file
+    print("Attempting to play the combined MIDI file...")
+    with stage("playback"):
+        play_midi_pygame(midi_file)
+    print(f"Combined MIDI file '{midi_file}' has been created.")
+
+if __name__ == "__main__":
+    with profiled_run("melody"):
+        main()
@@ -2,10 +2,19 @@ from mido import MidiFile, MidiTrack, MetaMessage
 import pygame
 from time import sleep
 import os
+import numpy as np
+from profiling import stage, profiled_run
+from groove import DEFAULT_GROOVE, groove_track
+from piano_roll import render_file
+from timebase import PPQ, DEFAULT_TEMPO_MAP, CONDUCTOR_META_TYPES, rescale_track
 
-def merge_midi_files(input_files, output_file):
+def merge_midi_files(input_files, output_file, tempo_map=DEFAULT_TEMPO_MAP, groove=None):
     """
     Merge multiple MIDI files into a single MIDI file.
+    The generators all write on the shared timebase (timebase.PPQ), so tracks are copied as they are;
+    the tempo map goes into one conductor track instead of being repeated in every track.
+    Files written at another resolution are rescaled first.
+    With a `groove` (see groove.Groove), every track is humanized on the way in.
     """
     # Check if all input files exist
     for file in input_files:
@@ -14,15 +23,34 @@ def merge_midi_files(input_files, output_file):
             return
     
     # Create a new MIDI file for merging
-    merged_midi = MidiFile()
+    merged_midi = MidiFile(type=1, ticks_per_beat=PPQ)
+    merged_midi.tracks.append(tempo_map.conductor_track())
 
     # Iterate through each input file and add its tracks to the merged MIDI
     for file in input_files:
         midi = MidiFile(file)
         for i, track in enumerate(midi.tracks):
+            track = rescale_track(track, midi.ticks_per_beat)
             merged_track = MidiTrack()
             merged_track.append(MetaMessage('track_name', name=f"{file}-Track-{i}"))
-            merged_track.extend(track)
+            if all(msg.is_meta for msg in track):
+                continue  # Tempo-only tracks are replaced by the conductor track
+            if any(msg.type in CONDUCTOR_META_TYPES for msg in track):
+                # Drop the tempo map of the input, keeping the timing of everything after it
+                carry = 0
+                for msg in track:
+                    if msg.type in CONDUCTOR_META_TYPES:
+                        carry += msg.time
+                    elif carry:
+                        merged_track.append(msg.copy(time=msg.time + carry))
+                        carry = 0
+                    else:
+                        merged_track.append(msg)
+            else:
+                merged_track.extend(track)
+            if groove is not None:
+                rng = np.random.default_rng((groove.seed, len(merged_midi.tracks)))
+                merged_track = groove_track(merged_track, groove, tempo_map, rng)
             merged_midi.tracks.append(merged_track)
     
     # Save the merged MIDI file
@@ -47,21 +75,34 @@ def play_midi_file(filename):
         pygame.mixer.quit()
         pygame.quit()
 
-# Specify the input files
-input_files = [
-    'createdFiles/chords.mid',
-    'createdFiles/melody.mid',
-    'createdFiles/drum_pattern.mid'
-]
+def main():
+    # Specify the input files
+    input_files = [
+        'createdFiles/chords.mid',
+        'createdFiles/melody.mid',
+        'createdFiles/drum_pattern.mid'
+    ]
 
-# Specify the output file
-output_file = 'createdFiles/merged_song.mid'
+    # Specify the output file
+    output_file = 'createdFiles/merged_song.mid'
 
-# Merge the files
-merge_midi_files(input_files, output_file)
+    # Merge the files
+    with stage("merge"):
+        merge_midi_files(input_files, output_file, groove=DEFAULT_GROOVE)
 
-# Play the merged MIDI file if it exists
-if os.path.exists(output_file):
-    play_midi_file(output_file)
-else:
-    print(f"Error: Merged file '{output_file}' not created.")
+    # Piano roll of the merged song, to check the timing at a glance
+    if os.path.exists(output_file):
+        with stage("render"):
+            for file_path in render_file(output_file):
+                print(f"Piano roll saved as '{file_path}'")
+
+    # Play the merged MIDI file if it exists
+    if os.path.exists(output_file):
+        with stage("playback"):
+            play_midi_file(output_file)
+    else:
+        print(f"Error: Merged file '{output_file}' not created.")
+
+if __name__ == "__main__":
+    with profiled_run("merge_tracks"):
+        main()
@@ -0,0 +1,169 @@
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+
+MAX_ORDER = 4
+CONTEXT_SEPARATOR = ' '
+
+
+class ChordNgramModel:
+    """
+    Order-k Markov chord model with backoff to lower orders.
+
+    Contexts (the last 1..k chords) are integer-encoded with each chord as a base-(V+1) digit
+    in 1..V, so every context length has distinct codes. Each order keeps a sorted array of
+    context codes, found by binary search, and CSR-style arrays of next chords and
+    cumulative weights, so a draw costs two binary searches.
+    """
+
+    def __init__(self, vocab, order=2):
+        if not 1 <= order <= MAX_ORDER:
+            raise ValueError(f"order must be between 1 and {MAX_ORDER}, got {order}")
+        self.vocab = list(vocab)
+        self.order = order
+        self.index = {chord: i for i, chord in enumerate(self.vocab)}
+        self.base = len(self.vocab) + 1
+
+        # Per order: sorted context codes, row offsets, next chord ids and cumulative weights
+        self.contexts = {m: array('q') for m in range(1, order + 1)}
+        self.offsets = {m: array('q', [0]) for m in range(1, order + 1)}
+        self.next_ids = {m: array('l') for m in range(1, order + 1)}
+        self.cumulative = {m: array('d') for m in range(1, order + 1)}
+        # Chords whose learned successors no longer apply (see forget)
+        self.forgotten = set()
+
+    def encode(self, context):
+        """
+        Encode a sequence of chords as a single integer.
+        """
+        code = 0
+        for chord in context:
+            code = code * self.base + self.index[chord] + 1
+        return code
+
+    @classmethod
+    def from_counts(cls, vocab, counts, order=None):
+        """
+        Build a model from n-gram counts.
+
+        Args:
+            vocab (list): Chord numerals of the key.
+            counts (dict): {"chord chord ...": {next_chord: count}} for contexts of 1..k chords,
+                as written by corpus.py.
+            order (int): Highest order to keep (defaults to the longest context in `counts`).
+        """
+        contexts = {}
+        for context, targets in counts.items():
+            chords = tuple(context.split(CONTEXT_SEPARATOR))
+            contexts[chords] = targets
+        if order is None:
+            order = max((len(chords) for chords in contexts), default=1)
+        model = cls(vocab, min(order, MAX_ORDER))
+
+        rows = {m: [] for m in range(1, model.order + 1)}
+        for chords, targets in contexts.items():
+            if len(chords) > model.order or any(chord not in model.index for chord in chords):
+                continue
+            next_chords = sorted(
+                (model.index[chord], count) for chord, count in targets.items()
+                if chord in model.index and count > 0
+            )
+            if next_chords:
+                rows[len(chords)].append((model.encode(chords), next_chords))
+
+        for m, order_rows in rows.items():
+            order_rows.sort()
+            for code, next_chords in order_rows:
+                model.contexts[m].append(code)
+                total = 0.0
+                for chord_id, count in next_chords:
+                    total += count
+                    model.next_ids[m].append(chord_id)
+                    model.cumulative[m].append(total)
+                model.offsets[m].append(len(model.next_ids[m]))
+        return model
+
+    @classmethod
+    def from_progressions(cls, vocab, progressions, order=2):
+        """
+        Count the n-grams of up to `order` context chords in the given progressions and build a model.
+        """
+        return cls.from_counts(vocab, count_ngrams(progressions, order), order)
+
+    def _row(self, m, context):
+        """
+        Return the (start, end) slice of the next-chord arrays for a context, or None if unseen.
+        """
+        code = self.encode(context)
+        contexts = self.contexts[m]
+        i = bisect_left(contexts, code)
+        if i == len(contexts) or contexts[i] != code:
+            return None
+        return self.offsets[m][i], self.offsets[m][i + 1]
+
+    def forget(self, chord):
+        """
+        Drop the learned successors of a chord: every context ending in it, at every order.
+        Used when the transitions out of the chord are edited by hand, so the caller's own
+        transitions take over for it.
+        """
+        self.forgotten.add(chord)
+
+    def next_chord(self, history, order=None, rng=random):
+        """
+        Sample the chord following `history`, backing off to shorter contexts when the longest
+        one was never seen.
+
+        Returns:
+            str: The next chord, or None when not even the last chord has known successors.
+        """
+        # Every context of every order ends in the last chord
+        if history and history[-1] in self.forgotten:
+            return None
+        order = min(order or self.order, self.order, len(history))
+        for m in range(order, 0, -1):
+            context = history[-m:]
+            if any(chord not in self.index for chord in context):
+                continue
+            row = self._row(m, context)
+            if row is None:
+                continue
+            start, end = row
+            cumulative = self.cumulative[m]
+            target = rng.random() * cumulative[end - 1]
+            i = bisect_right(cumulative, target, start, end - 1)
+            return self.vocab[self.next_ids[m][i]]
+        return None
+
+    def memory_bytes(self):
+        """
+        Size of the index arrays in bytes.
+        """
+        return sum(
+            a.itemsize * len(a)
+            for arrays in (self.contexts, self.offsets, self.next_ids, self.cumulative)
+            for a in arrays.values()
+        )
+
+
+def count_ngrams(progressions, order=MAX_ORDER, counts=None):
+    """
+    Count (context, next chord) pairs for every context length from 1 to `order`.
+
+    Args:
+        progressions (iterable): Lists of chord numerals.
+        order (int): Longest context to count.
+        counts (dict): Existing counts to add to, in the same format as the result.
+
+    Returns:
+        dict: {"chord chord ...": {next_chord: count}}
+    """
+    counts = {} if counts is None else counts
+    for progression in progressions:
+        for i in range(1, len(progression)):
+            next_chord = progression[i]
+            for m in range(1, min(order, i) + 1):
+                context = CONTEXT_SEPARATOR.join(progression[i - m:i])
+                targets = counts.setdefault(context, {})
+                targets[next_chord] = targets.get(next_chord, 0) + 1
+    return counts
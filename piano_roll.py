@@ -0,0 +1,225 @@
+import os
+import glob
+import zlib
+import struct
+import argparse
+
+import numpy as np
+from mido import MidiFile
+
+from profiling import stage, profiled_run
+from timebase import NOTE_DTYPE, TempoMap, split_track
+
+BACKGROUND = (250, 250, 250)
+BLACK_KEY_ROW = (236, 236, 240)
+BAR_LINE = (200, 200, 210)
+# Note colors, one per track in order
+TRACK_COLORS = [
+    (66, 133, 244),
+    (234, 67, 53),
+    (52, 168, 83),
+    (251, 188, 5),
+    (171, 71, 188),
+    (0, 172, 193),
+]
+BLACK_KEYS = (1, 3, 6, 8, 10)
+
+# Output sizes: thumbnails have a fixed width, full size a fixed scale
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_ROW_HEIGHT = 2
+FULL_PIXELS_PER_BEAT = 24
+FULL_ROW_HEIGHT = 4
+# Full-size images wider than this are split into tiles, so memory stays bounded for long songs
+TILE_WIDTH = 4096
+
+
+def encode_png(image, level=6):
+    """
+    Encode an RGB image (height x width x 3 uint8 array) as PNG bytes.
+    """
+    height, width, _ = image.shape
+    # Every scanline uses filter type 2 (difference to the row above): a piano roll repeats
+    # most rows, which then become zeros and compress quickly
+    rows = image.reshape(height, width * 3)
+    raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 0] = 2
+    raw[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=raw[1:, 1:])
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), level)) + chunk(b"IEND", b""))
+
+
+def write_png(file_path, image, level=6):
+    with open(file_path, 'wb') as f:
+        f.write(encode_png(image, level))
+    return file_path
+
+
+def song_notes(midi):
+    """
+    Collect the notes of every track of a MidiFile.
+
+    Returns:
+        tuple: (NOTE_DTYPE array sorted by onset, track number of every note); tracks without
+        notes (such as the conductor track) are left out of the numbering.
+    """
+    parts = [notes for notes, _ in map(split_track, midi.tracks) if len(notes)]
+    if not parts:
+        return np.empty(0, dtype=NOTE_DTYPE), np.empty(0, dtype=np.int64)
+    notes = np.concatenate(parts)
+    tracks = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+    order = np.argsort(notes['start'], kind='stable')
+    return notes[order], tracks[order]
+
+
+def render(notes, tracks, start_tick, end_tick, width, pitch_range, row_height=1, tempo_map=None):
+    """
+    Rasterize the notes overlapping [start_tick, end_tick) into an RGB image.
+    Note rectangles are drawn with one difference array per track, summed along time,
+    so the cost does not depend on how many notes there are.
+
+    Args:
+        notes (np.ndarray): NOTE_DTYPE array.
+        tracks (np.ndarray): Track number of every note (picks its color).
+        start_tick (int): First tick shown.
+        end_tick (int): Tick after the last one shown.
+        width (int): Image width in pixels.
+        pitch_range (tuple): (lowest, highest) pitch shown.
+        row_height (int): Pixel rows per pitch.
+        tempo_map (TempoMap): Draws bar lines when given.
+
+    Returns:
+        np.ndarray: height x width x 3 uint8 image.
+    """
+    low, high = pitch_range
+    rows = high - low + 1
+    span = max(end_tick - start_tick, 1)
+    num_tracks = int(tracks.max()) + 1 if len(tracks) else 0
+
+    image = np.empty((rows, width, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+    image[np.isin((high - np.arange(rows)) % 12, BLACK_KEYS)] = BLACK_KEY_ROW
+    if tempo_map is not None:
+        column_ticks = start_tick + np.arange(width) * span // width
+        bars, offsets = tempo_map.bar_positions(column_ticks)
+        # A bar line wherever the bar number changes, and at the left edge when it starts a bar
+        bar_columns = np.flatnonzero(np.diff(bars, prepend=bars[0] - (offsets[0] == 0)))
+        if len(bar_columns) < width // 4:  # skip bar lines packed too densely to read
+            image[:, bar_columns] = BAR_LINE
+
+    ends = notes['start'] + notes['duration']
+    shown = (ends > start_tick) & (notes['start'] < end_tick) & (notes['note'] >= low) & (notes['note'] <= high)
+    notes, tracks, ends = notes[shown], tracks[shown], ends[shown]
+    x0 = np.clip((notes['start'] - start_tick) * width // span, 0, width - 1)
+    x1 = np.clip((ends - start_tick) * width // span, x0 + 1, width)
+    cells = (tracks * rows + (high - notes['note'].astype(np.int64))) * (width + 1)
+    size = num_tracks * rows * (width + 1)
+    diff = np.bincount(cells + x0, minlength=size) - np.bincount(cells + x1, minlength=size)
+    covered = np.cumsum(diff.reshape(num_tracks, rows, width + 1), axis=2)[:, :, :width] > 0
+    onsets = np.zeros((num_tracks, rows, width), dtype=bool)
+    # Notes carried over from before start_tick are clipped to the left edge but did not start there
+    starts = notes['start'] >= start_tick
+    onsets[tracks[starts], high - notes['note'][starts].astype(np.int64), x0[starts]] = True
+
+    for track in range(num_tracks):
+        color = np.array(TRACK_COLORS[track % len(TRACK_COLORS)], dtype=np.uint8)
+        image[covered[track]] = color
+        image[onsets[track]] = color // 2  # darker onsets separate repeated notes
+    return np.repeat(image, row_height, axis=0) if row_height > 1 else image
+
+
+def pitch_range(notes, margin=2):
+    if not len(notes):
+        return 60, 72
+    return max(int(notes['note'].min()) - margin, 0), min(int(notes['note'].max()) + margin, 127)
+
+
+def render_thumbnail(notes, tracks, tempo_map, width=THUMBNAIL_WIDTH):
+    """
+    The whole song squeezed into a fixed width.
+    """
+    end_tick = int((notes['start'] + notes['duration']).max()) if len(notes) else tempo_map.ppq
+    return render(notes, tracks, 0, end_tick, width, pitch_range(notes), THUMBNAIL_ROW_HEIGHT)
+
+
+def render_tiles(notes, tracks, tempo_map, pixels_per_beat=FULL_PIXELS_PER_BEAT, tile_width=TILE_WIDTH):
+    """
+    Render the song at a fixed scale, one tile of at most `tile_width` pixels at a time.
+    Each tile only looks at the notes near it, so very long songs never need the whole image in memory.
+
+    Yields:
+        np.ndarray: The tiles, left to right.
+    """
+    ppq = tempo_map.ppq
+    ends = notes['start'] + notes['duration']
+    end_tick = int(ends.max()) if len(notes) else ppq
+    longest = int(notes['duration'].max()) if len(notes) else 0
+    total_width = max(-(-end_tick * pixels_per_beat // ppq), 1)
+    pitches = pitch_range(notes)
+
+    for left in range(0, total_width, tile_width):
+        right = min(left + tile_width, total_width)
+        start_tick, stop_tick = left * ppq // pixels_per_beat, right * ppq // pixels_per_beat
+        # Notes are sorted by onset: only those starting within one longest note before the tile can reach it
+        lo = np.searchsorted(notes['start'], start_tick - longest)
+        hi = np.searchsorted(notes['start'], stop_tick)
+        yield render(notes[lo:hi], tracks[lo:hi], start_tick, stop_tick, right - left, pitches,
+                     FULL_ROW_HEIGHT, tempo_map)
+
+
+def render_file(midi_path, folder_name='createdFiles', thumbnail=True, full=True):
+    """
+    Write the piano roll of a MIDI file as '<name>_thumb.png' and '<name>_roll.png'
+    ('<name>_roll_000.png', ... when the song needs several tiles).
+
+    Returns:
+        list: The paths written.
+    """
+    os.makedirs(folder_name, exist_ok=True)
+    midi = MidiFile(midi_path)
+    tempo_map = TempoMap.from_midi(midi)
+    notes, tracks = song_notes(midi)
+    name = os.path.splitext(os.path.basename(midi_path))[0]
+    paths = []
+    if thumbnail:
+        paths.append(write_png(os.path.join(folder_name, f"{name}_thumb.png"),
+                               render_thumbnail(notes, tracks, tempo_map)))
+    if full:
+        # Tiles left by an earlier, longer render of the same file would pass for part of this one
+        for stale in glob.glob(os.path.join(glob.escape(folder_name), glob.escape(name) + "_roll*.png")):
+            os.remove(stale)
+        tiles = render_tiles(notes, tracks, tempo_map)
+        full_paths = []
+        for i, tile in enumerate(tiles):
+            full_paths.append(write_png(os.path.join(folder_name, f"{name}_roll_{i:03d}.png"), tile))
+        if len(full_paths) == 1:
+            single = os.path.join(folder_name, f"{name}_roll.png")
+            os.replace(full_paths[0], single)
+            full_paths = [single]
+        paths.extend(full_paths)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render piano-roll PNGs of MIDI files.")
+    parser.add_argument("midi", nargs="+", help="MIDI files to render.")
+    parser.add_argument("--output", default="createdFiles", help="Folder for the PNG files.")
+    parser.add_argument("--size", choices=("thumbnail", "full", "both"), default="both",
+                        help="Which images to write.")
+    args = parser.parse_args()
+
+    with stage("render", files=len(args.midi)):
+        for midi_path in args.midi:
+            paths = render_file(midi_path, args.output,
+                                thumbnail=args.size != "full", full=args.size != "thumbnail")
+            print(f"Piano roll of '{midi_path}' saved as {', '.join(repr(path) for path in paths)}")
+
+
+if __name__ == "__main__":
+    with profiled_run("piano_roll"):
+        main()
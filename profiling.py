@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+# Environment flags, so the settings reach every script that sequence.py launches
+LOG_LEVEL_ENV = "GRAPHMUSIC_LOG_LEVEL"
+PROFILE_ENV = "GRAPHMUSIC_PROFILE"
+TRACEMALLOC_ENV = "GRAPHMUSIC_TRACEMALLOC"
+METRICS_DIR_ENV = "GRAPHMUSIC_METRICS_DIR"
+
+DEFAULT_METRICS_DIR = os.path.join("createdFiles", "metrics")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# Stages recorded during the current run
+_stages = []
+_run_start = None
+
+
+def _flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+def get_logger(name):
+    """
+    Return a logger for a GraphMusic script.
+    The level comes from GRAPHMUSIC_LOG_LEVEL (default WARNING), so per-note
+    debug messages are dropped before any formatting happens. An unknown level
+    falls back to WARNING instead of failing the script.
+    """
+    root = logging.getLogger("graphmusic")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+        level = os.environ.get(LOG_LEVEL_ENV, "WARNING").upper()
+        root.setLevel(level if level in LOG_LEVELS else "WARNING")
+        root.propagate = False
+        if level not in LOG_LEVELS:
+            root.warning("Unknown %s %r, using WARNING (choose from %s)",
+                         LOG_LEVEL_ENV, level, ", ".join(LOG_LEVELS))
+    return root.getChild(name)
+
+
+@contextmanager
+def stage(name, **attrs):
+    """
+    Time a pipeline stage (graph build, sampling, MIDI encode, merge, render, playback).
+    When tracemalloc is tracing, the allocated and peak memory of the stage are recorded too.
+
+    Args:
+        name (str): Stage name.
+        **attrs: Extra values stored with the stage (e.g. section or file names).
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        record = {"name": name, "start": start, "seconds": end - start, "attrs": attrs}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            record["allocated_bytes"] = current - start_mem
+            record["peak_bytes"] = peak - start_mem
+        _stages.append(record)
+
+
+def stage_summary():
+    """
+    Return the recorded stages as a list of dictionaries, with times relative to the run start.
+    """
+    origin = _run_start if _run_start is not None else min((s["start"] for s in _stages), default=0.0)
+    summary = []
+    for record in _stages:
+        entry = dict(record)
+        entry["start"] = record["start"] - origin
+        summary.append(entry)
+    return summary
+
+
+def chrome_trace(run_name):
+    """
+    Convert the recorded stages into the Chrome trace event format (chrome://tracing, Perfetto).
+    """
+    pid = os.getpid()
+    events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": run_name}}]
+    for record in stage_summary():
+        args = dict(record["attrs"])
+        for field in ("allocated_bytes", "peak_bytes"):
+            if field in record:
+                args[field] = record[field]
+        events.append({
+            "name": record["name"],
+            "ph": "X",
+            "ts": record["start"] * 1e6,
+            "dur": record["seconds"] * 1e6,
+            "pid": pid,
+            "tid": 0,
+            "args": args,
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_report(run_name, folder_name=None):
+    """
+    Write '<run_name>.json' (stage metrics) and '<run_name>.trace.json' (Chrome trace)
+    to the metrics folder.
+
+    Returns:
+        str: Path of the JSON metrics file.
+    """
+    folder_name = folder_name or os.environ.get(METRICS_DIR_ENV, DEFAULT_METRICS_DIR)
+    os.makedirs(folder_name, exist_ok=True)
+
+    stages = stage_summary()
+    report = {
+        "run": run_name,
+        "pid": os.getpid(),
+        "total_seconds": sum(s["seconds"] for s in stages),
+        "stages": stages,
+    }
+    file_path = os.path.join(folder_name, f"{run_name}.json")
+    with open(file_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    with open(os.path.join(folder_name, f"{run_name}.trace.json"), "w") as f:
+        json.dump(chrome_trace(run_name), f, default=str)
+    return file_path
+
+
+@contextmanager
+def profiled_run(run_name, folder_name=None):
+    """
+    Instrument a whole script run.
+    GRAPHMUSIC_TRACEMALLOC=1 records per-stage memory, GRAPHMUSIC_PROFILE=1 saves a
+    cProfile dump as '<run_name>.prof'. The stage report is written when the run ends.
+    """
+    global _run_start
+    folder_name = folder_name or os.environ.get(METRICS_DIR_ENV, DEFAULT_METRICS_DIR)
+    logger = get_logger(run_name)
+
+    _stages.clear()
+    _run_start = time.perf_counter()
+
+    started_tracemalloc = _flag(TRACEMALLOC_ENV) and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if _flag(PROFILE_ENV) else None
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(folder_name, exist_ok=True)
+            profiler.dump_stats(os.path.join(folder_name, f"{run_name}.prof"))
+        if started_tracemalloc:
+            tracemalloc.stop()
+        report_path = write_report(run_name, folder_name)
+        logger.info("Stage metrics saved as '%s'", report_path)
@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import argparse
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
+from profiling import stage, profiled_run
+
+# Phoneme rhyme keys from the CMU dictionary when the optional `pronouncing` package is installed
+try:
+    import pronouncing
+except ImportError:
+    pronouncing = None
+
+DEFAULT_INDEX_PATH = os.path.join('createdFiles', 'rhyme_index.json')
+VOWELS = "aeiouy"
+_word_pattern = re.compile(r"[a-z0-9']+")
+_vowel_group = re.compile(f"[{VOWELS}]+")
+
+
+def orthographic_key(word):
+    """
+    Spelling-based rhyme key: the last vowel group and everything after it.
+    A silent final 'e' pulls the key back one vowel group ("astute" -> "ute").
+    """
+    groups = list(_vowel_group.finditer(word))
+    if not groups:
+        return word
+    last = groups[-1]
+    if len(groups) > 1 and last.group() == "e" and last.end() == len(word) and last.start() > groups[-2].end():
+        last = groups[-2]
+    return word[last.start():]
+
+
+@lru_cache(maxsize=65536)
+def rhyme_key(word):
+    """
+    Rhyme key of a single word (memoized, since corpora repeat the same endings heavily).
+    Uses the stressed rhyming part of the CMU pronunciation when available, else the spelling.
+    """
+    word = word.lower()
+    if pronouncing is not None:
+        phones = pronouncing.phones_for_word(word)
+        if phones:
+            return "/" + pronouncing.rhyming_part(phones[0])
+    return orthographic_key(word)
+
+
+def line_rhyme_key(line):
+    """
+    Rhyme key of a lyric line, taken from its last word.
+    """
+    words = _word_pattern.findall(line.lower())
+    return rhyme_key(words[-1].strip("'")) if words else ""
+
+
+def _keys_for_chunk(lines):
+    return [line_rhyme_key(line) for line in lines]
+
+
+def group_name(number):
+    """
+    Spreadsheet-style group names: A..Z, AA, AB, ...
+    """
+    name = ""
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+
+class RhymeIndex:
+    """
+    Hash index from rhyme key to rhyme group, with the lines of every group.
+    Lines can be added incrementally and the index saved and reloaded.
+    """
+
+    def __init__(self):
+        self.keys = {}     # rhyme key -> group name
+        self.groups = {}   # group name -> lines
+        self.phonetic = pronouncing is not None
+        self._lines = set()
+
+    def add(self, line, key):
+        """
+        Add one line under its rhyme key, creating a new group for an unseen key.
+        """
+        if not key or line in self._lines:
+            return
+        group = self.keys.get(key)
+        if group is None:
+            group = group_name(len(self.keys))
+            self.keys[key] = group
+            self.groups[group] = []
+        self.groups[group].append(line)
+        self._lines.add(line)
+
+    def add_lines(self, lines):
+        """
+        Add lines in the current process.
+        """
+        for line in lines:
+            self.add(line, line_rhyme_key(line))
+
+    def rhyme_groups(self, min_size=2):
+        """
+        Return the groups in the `rhyme_groups` format used by lyrics.create_lyrics_graph,
+        leaving out groups too small to rhyme.
+        """
+        return {group: list(lines) for group, lines in self.groups.items() if len(lines) >= min_size}
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"phonetic": self.phonetic, "keys": self.keys, "groups": self.groups}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        index = cls()
+        if data["phonetic"] != index.phonetic:
+            raise ValueError(
+                f"'{path}' was built with {'phoneme' if data['phonetic'] else 'spelling'} rhyme keys; "
+                f"{'install' if data['phonetic'] else 'uninstall'} 'pronouncing' to extend it"
+            )
+        index.keys = data["keys"]
+        index.groups = data["groups"]
+        index._lines = {line for lines in index.groups.values() for line in lines}
+        return index
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def build_index(lines, index=None, workers=None, chunk_size=10000):
+    """
+    Group lines by rhyme key in one streaming pass.
+    Rhyme keys are computed in parallel, chunk by chunk; the parent only assigns groups.
+
+    Args:
+        lines (iterable): Lyric lines.
+        index (RhymeIndex): Existing index to extend (a new one when None).
+        workers (int): Worker processes (defaults to the CPU count).
+        chunk_size (int): Lines per worker task.
+
+    Returns:
+        RhymeIndex
+    """
+    index = index if index is not None else RhymeIndex()
+    workers = workers or os.cpu_count() or 1
+    lines = iter(lines)
+
+    def chunks():
+        while True:
+            chunk = list(islice(lines, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    chunk_iter = chunks()
+    with Pool(workers) as pool:
+        while True:
+            # A few chunks per worker at a time, so the input is never read ahead in full
+            batch = list(islice(chunk_iter, 4 * workers))
+            if not batch:
+                break
+            for chunk, keys in zip(batch, pool.imap(_keys_for_chunk, batch)):
+                for line, key in zip(chunk, keys):
+                    index.add(line, key)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover rhyme groups in a lyric corpus (one line per row).")
+    parser.add_argument("corpus", nargs="+", help="Text files with one lyric line per row.")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH,
+                        help="Rhyme index to create or extend.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    args = parser.parse_args()
+
+    index = RhymeIndex.load(args.index) if os.path.exists(args.index) else RhymeIndex()
+    for path in args.corpus:
+        with stage("rhyme grouping", corpus=path):
+            build_index(read_lines(path), index, args.workers)
+    index.save(args.index)
+
+    groups = index.rhyme_groups()
+    print(f"{sum(len(lines) for lines in index.groups.values())} lines in {len(index.groups)} rhyme groups "
+          f"({len(groups)} with at least two lines)")
+    print(f"Rhyme index saved as '{args.index}'")
+
+
+if __name__ == "__main__":
+    with profiled_run("rhyme"):
+        main()
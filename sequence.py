@@ -1,21 +1,55 @@
+import os
 import yaml
+import argparse
 import subprocess
+from profiling import (stage, profiled_run, LOG_LEVEL_ENV, LOG_LEVELS, PROFILE_ENV,
+                       TRACEMALLOC_ENV, METRICS_DIR_ENV)
 
-# Load the YAML file
-with open('program_sequence.yml', 'r') as f:
-    sequence = yaml.safe_load(f)['sequence']
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the GraphMusic generation pipeline.")
+    parser.add_argument("--log-level", default=None, type=str.upper, choices=LOG_LEVELS,
+                        help="Logging level for every step (e.g. DEBUG to log each picked note).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Save a cProfile dump for every step.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record per-stage allocations with tracemalloc.")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="Folder for the JSON metrics and Chrome trace files.")
+    return parser.parse_args()
 
-# Execute each step in the sequence
-for step in sequence:
-    print(f"Step: {step['name']}")
-    print(f"Description: {step['description']}")
-    
-    # Run the script
-    result = subprocess.run(step['script'], shell=True)
-    
-    # Check if the step succeeded
-    if result.returncode != 0:
-        print(f"Error: Step '{step['name']}' failed!")
-        break
-    
-    print(f"Output file: {step['output']}\n")
+def main():
+    args = parse_args()
+
+    # Pass the instrumentation settings on to every step
+    if args.log_level:
+        os.environ[LOG_LEVEL_ENV] = args.log_level
+    if args.profile:
+        os.environ[PROFILE_ENV] = "1"
+    if args.trace_memory:
+        os.environ[TRACEMALLOC_ENV] = "1"
+    if args.metrics_dir:
+        os.environ[METRICS_DIR_ENV] = args.metrics_dir
+
+    # Load the YAML file
+    with open('program_sequence.yml', 'r') as f:
+        sequence = yaml.safe_load(f)['sequence']
+
+    # Execute each step in the sequence
+    for step in sequence:
+        print(f"Step: {step['name']}")
+        print(f"Description: {step['description']}")
+        
+        # Run the script
+        with stage(step['name'], script=step['script']):
+            result = subprocess.run(step['script'], shell=True)
+        
+        # Check if the step succeeded
+        if result.returncode != 0:
+            print(f"Error: Step '{step['name']}' failed!")
+            break
+        
+        print(f"Output file: {step['output']}\n")
+
+if __name__ == "__main__":
+    with profiled_run("sequence"):
+        main()
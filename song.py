@@ -0,0 +1,346 @@
+import os
+import time
+import uuid
+import zlib
+import struct
+import random
+import argparse
+from functools import lru_cache
+from collections import namedtuple
+
+import drum
+import melody
+from Chords import ChordProgressionGenerator, CHORD_MODEL_PATH
+from fingerprint import SongIndex, song_shingles, generate_unique
+from archive import SongArchive
+from profiling import stage, profiled_run
+from timebase import PPQ, DEFAULT_TEMPO_MAP
+
+CHORD_BEATS = 2
+
+CHORD_CHANNEL = 0
+MELODY_CHANNEL = 1
+DRUM_CHANNEL = 9
+TRACK_NAMES = ("Chords", "Melody", "Drums")
+
+SONG_INDEX_PATH = os.path.join('createdFiles', 'song_index.sqlite')
+
+# A section as written in a song: the lyric lines it sets, the chord key and progression length
+Section = namedtuple("Section", ["name", "lines", "key", "chord_length"])
+
+# A rendered section: the sampled parts and one encoded chunk per track (see encode_chunk)
+RenderedSection = namedtuple("RenderedSection", ["chords", "melody", "drums", "length", "chunks"])
+
+_generator = None
+
+
+def chord_generator():
+    """
+    Shared chord generator, using the learned chord model when one exists.
+    """
+    global _generator
+    if _generator is None:
+        model_path = CHORD_MODEL_PATH if os.path.exists(CHORD_MODEL_PATH) else None
+        _generator = ChordProgressionGenerator(model_path)
+    return _generator
+
+
+def encode_varlen(value):
+    """
+    Encode an integer as a MIDI variable-length quantity.
+    """
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(data))
+
+
+def encode_chunk(events, length):
+    """
+    Encode the events of one track of one section.
+
+    Args:
+        events (list): (tick, message bytes) pairs, ticks relative to the section start.
+        length (int): Section length in ticks.
+
+    Returns:
+        tuple: (lead, body, tail): ticks before the first event, the encoded events with the
+        first delta left out, and ticks between the last event and the section end.
+        The delta of the first event depends on the previous section, so it is added when the
+        song is assembled.
+    """
+    if not events:
+        return length, b"", 0
+    events = sorted(events, key=lambda event: event[0])
+    parts = [events[0][1]]
+    previous = events[0][0]
+    for tick, data in events[1:]:
+        parts.append(encode_varlen(tick - previous))
+        parts.append(data)
+        previous = tick
+    return events[0][0], b"".join(parts), length - previous
+
+
+def chord_events(generator, key, progression):
+    events = []
+    tick = 0
+    for chord_numeral in progression:
+        for note in generator.keys[key][chord_numeral]:
+            midi_note = generator.note_to_midi[note]
+            events.append((tick, bytes([0x90 | CHORD_CHANNEL, midi_note, 100])))
+            events.append((tick + CHORD_BEATS * PPQ, bytes([0x80 | CHORD_CHANNEL, midi_note, 100])))
+        tick += CHORD_BEATS * PPQ
+    return events, tick
+
+
+def melody_events(notes):
+    events = []
+    tick = 0
+    for note_data in notes:
+        events.append((tick, bytes([0x90 | MELODY_CHANNEL, note_data["note"], note_data["velocity"]])))
+        tick += note_data["duration"]
+        events.append((tick, bytes([0x80 | MELODY_CHANNEL, note_data["note"], note_data["velocity"]])))
+    return events, tick
+
+
+def drum_events(drum_sequence):
+    events = []
+    tick = 0
+    for note_name in drum_sequence:
+        note = drum.DRUM_NOTES[note_name]
+        events.append((tick, bytes([0x90 | DRUM_CHANNEL, note, 64])))
+        tick += PPQ
+        events.append((tick, bytes([0x80 | DRUM_CHANNEL, note, 64])))
+    return events, tick
+
+
+@lru_cache(maxsize=1024)
+def render_section(section, melody_palette, seed, bar_ticks, chord_version):
+    """
+    Sample and encode one section. Memoized on the section content, its melody palette, the
+    seed and the chord generator version, so a section repeated in a song (or unchanged between
+    edits) is generated only once, and editing a chord transition renders it again.
+
+    Args:
+        section (Section): The section to render.
+        melody_palette (tuple): (note, velocity, duration) tuples the melody is picked from.
+        seed (int): Seed of the section's random generator.
+        bar_ticks (int): Bar length; sections are padded to whole bars.
+        chord_version (int): `version` of the shared chord generator.
+
+    Returns:
+        RenderedSection
+    """
+    rng = random.Random(seed)
+    generator = chord_generator()
+    lines = [(line, section.name) for line in section.lines]
+    palette = {section.name: [
+        {"note": note, "velocity": velocity, "duration": duration}
+        for note, velocity, duration in melody_palette
+    ]}
+
+    chords = generator.generate_section(section.key, length=section.chord_length, order=3, rng=rng)
+    melody_notes, _ = melody.generate_melody_pattern_with_recording(lines, palette, rng=rng)
+    drum_sequence = drum.generate_drum_pattern(lines, rng=rng)
+
+    tracks = [
+        chord_events(generator, section.key, chords),
+        melody_events(melody_notes),
+        drum_events(drum_sequence),
+    ]
+    # Every track of a section spans the same whole number of bars, so sections stay aligned
+    length = -(-max(end for _, end in tracks) // bar_ticks) * bar_ticks
+    chunks = tuple(encode_chunk(events, length) for events, _ in tracks)
+    return RenderedSection(tuple(chords), tuple(melody_notes), tuple(drum_sequence), length, chunks)
+
+
+class Song:
+    """
+    A song as an ordered structure of named sections.
+    Each distinct section is rendered once and referenced wherever it repeats; editing a
+    section re-renders only that section, and assembling the MIDI file just joins the cached
+    byte chunks of every track.
+    """
+
+    def __init__(self, sections, structure, seed=0, melody_map=None, tempo_map=DEFAULT_TEMPO_MAP):
+        """
+        Args:
+            sections (dict): Section name -> Section.
+            structure (list): Section names in playing order (names may repeat).
+            seed (int): Song seed; every section derives its own seed from it.
+            melody_map (dict): Melody palette per section name (defaults to melody.melody_map).
+            tempo_map (TempoMap): Tempo and time signature, written to the conductor track.
+        """
+        self.sections = dict(sections)
+        self.structure = list(structure)
+        self.seed = seed
+        self.section_seeds = {}  # Per-section seed overrides set by edit_section
+        self.melody_map = melody_map if melody_map is not None else melody.melody_map
+        self.tempo_map = tempo_map
+
+    @classmethod
+    def from_lyrics(cls, lyrics, keys=None, chord_length=4, seed=0):
+        """
+        Build a song from (line, section) pairs such as `melody.lyrics`.
+        Consecutive lines with the same section name form one section.
+
+        Args:
+            lyrics (list): (line, section name) pairs in order.
+            keys (dict): Chord key per section name (default 'C', 'Am' for the Bridge).
+            chord_length (int): Chords per section.
+            seed (int): Song seed.
+        """
+        keys = keys if keys is not None else {"Bridge": "Am"}
+        runs = []
+        for line, name in lyrics:
+            if runs and runs[-1][0] == name:
+                runs[-1][1].append(line)
+            else:
+                runs.append((name, [line]))
+
+        sections = {}
+        structure = []
+        for name, lines in runs:
+            section = Section(name, tuple(lines), keys.get(name, "C"), chord_length)
+            # A repeated name with different lines becomes its own section
+            label = name
+            count = 1
+            while label in sections and sections[label] != section:
+                count += 1
+                label = f"{name} ({count})"
+            sections[label] = section
+            structure.append(label)
+        return cls(sections, structure, seed)
+
+    def section_seed(self, label):
+        if label in self.section_seeds:
+            return self.section_seeds[label]
+        return zlib.crc32(f"{self.seed}:{label}".encode())
+
+    def render(self, label):
+        """
+        Return the rendered section (cached).
+        """
+        section = self.sections[label]
+        palette = tuple(
+            (note["note"], note["velocity"], note["duration"])
+            for note in self.melody_map.get(section.name, [])
+        )
+        return render_section(section, palette, self.section_seed(label), self.tempo_map.ticks_per_bar(),
+                              chord_generator().version)
+
+    def edit_section(self, label, **changes):
+        """
+        Change a section (lines, key or chord_length). Only this section is rendered again.
+        Pass seed=... to resample it with a different seed.
+        """
+        if "seed" in changes:
+            self.section_seeds[label] = changes.pop("seed")
+        self.sections[label] = self.sections[label]._replace(**changes)
+
+    def to_bytes(self):
+        """
+        Assemble the song into a type 1 MIDI file: a conductor track with the tempo map,
+        then one track each for chords, melody and drums.
+        """
+        rendered = [self.render(label) for label in self.structure]
+
+        conductor = [b"\x00\xff\x03", encode_varlen(len(b"Conductor")), b"Conductor"]
+        previous = 0
+        for tick, msg in self.tempo_map.meta_messages():
+            conductor.append(encode_varlen(tick - previous) + bytes(msg.bytes()))
+            previous = tick
+        conductor.append(b"\x00\xff\x2f\x00")
+        data = b"".join(conductor)
+        tracks = [b"MTrk" + struct.pack(">I", len(data)) + data]
+
+        for track_index, name in enumerate(TRACK_NAMES):
+            name_bytes = name.encode()
+            parts = [b"\x00\xff\x03", encode_varlen(len(name_bytes)), name_bytes]
+            carry = 0
+            for section in rendered:
+                lead, body, tail = section.chunks[track_index]
+                if body:
+                    parts.append(encode_varlen(carry + lead))
+                    parts.append(body)
+                    carry = tail
+                else:
+                    carry += lead
+            parts.append(encode_varlen(carry) + b"\xff\x2f\x00")
+            data = b"".join(parts)
+            tracks.append(b"MTrk" + struct.pack(">I", len(data)) + data)
+        header = b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), self.tempo_map.ppq)
+        return header + b"".join(tracks)
+
+    def save(self, folder_name='createdFiles', filename='song.mid'):
+        """
+        Write the song as a MIDI file.
+
+        Returns:
+            str: The full path of the saved MIDI file.
+        """
+        os.makedirs(folder_name, exist_ok=True)
+        file_path = os.path.join(folder_name, filename)
+        with open(file_path, 'wb') as f:
+            f.write(self.to_bytes())
+        return file_path
+
+    def shingles(self):
+        """
+        Fingerprint shingles of the whole song (see fingerprint.song_shingles).
+        """
+        rendered = [self.render(label) for label in self.structure]
+        return song_shingles(
+            chords=[chord for section in rendered for chord in section.chords],
+            melody=[note["note"] for section in rendered for note in section.melody],
+            drums=[hit for section in rendered for hit in section.drums],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a whole song section by section.")
+    parser.add_argument("--seed", type=int, default=None, help="Song seed (random by default).")
+    parser.add_argument("--threshold", type=float, default=0.8,
+                        help="Regenerate songs at least this similar to an earlier song.")
+    parser.add_argument("--archive", default=None,
+                        help="Append the song to this archive file (see archive.py) instead of writing .mid files.")
+    args = parser.parse_args()
+
+    first_seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    seeds = iter(range(first_seed, first_seed + 1000))
+
+    song_id = uuid.uuid4().hex
+    with stage("sampling"), SongIndex(SONG_INDEX_PATH) as index:
+        song, _ = generate_unique(
+            lambda: Song.from_lyrics(melody.lyrics, seed=next(seeds)),
+            Song.shingles, index, song_id=song_id, threshold=args.threshold,
+        )
+    with stage("MIDI encode"):
+        artifacts = {'song.mid': song.to_bytes()}
+    print(f"Song {song_id} (seed {song.seed}), structure: {' | '.join(song.structure)}")
+
+    # Iterating on one section only renders that section again
+    start = time.perf_counter()
+    with stage("edit", section="Bridge"):
+        song.edit_section("Bridge", chord_length=6)
+        artifacts['song_edited.mid'] = song.to_bytes()
+    print(f"Edited Bridge in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    with stage("save"):
+        if args.archive:
+            with SongArchive(args.archive) as archive:
+                archive.append(song_id, artifacts)
+            print(f"Saved {', '.join(artifacts)} to '{args.archive}'")
+        else:
+            for filename, data in artifacts.items():
+                file_path = os.path.join('createdFiles', filename)
+                with open(file_path, 'wb') as f:
+                    f.write(data)
+                print(f"Saved '{file_path}'")
+
+
+if __name__ == "__main__":
+    with profiled_run("song"):
+        main()
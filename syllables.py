@@ -0,0 +1,267 @@
+import re
+import argparse
+from functools import lru_cache
+from itertools import chain, islice
+from collections import namedtuple
+
+import numpy as np
+from mido import MetaMessage
+
+from profiling import stage, profiled_run
+from timebase import NOTE_DTYPE, DEFAULT_TEMPO_MAP
+
+# CMU dictionary stresses when the optional `pronouncing` package is installed
+try:
+    import pronouncing
+except ImportError:
+    pronouncing = None
+
+_word_pattern = re.compile(r"[A-Za-z0-9']+")
+_vowel_group = re.compile(r"[aeiouy]+")
+VOWELS = "aeiouy"
+# Consonant pairs that stay together at the start of a syllable
+DIGRAPHS = ("th", "ch", "sh", "ph", "wh", "gh")
+ONSETS = DIGRAPHS + ("bl", "br", "cl", "cr", "dr", "fl", "fr", "gl", "gr", "pl", "pr", "sc", "sk", "sp", "st", "tr")
+TRIPLE_ONSETS = ("thr", "shr", "scr", "spl", "spr", "str")
+UNSTRESSED_PREFIXES = ("be", "de", "re", "con", "com", "en", "ex", "in", "pre", "pur", "un")
+FUNCTION_WORDS = frozenset(
+    "a an the of to in on at by for from with as and or but so if is are was were be "
+    "it its we our us me my you your he she they them their this that like".split()
+)
+
+# Stress values follow the CMU dictionary: 0 unstressed, 1 primary, 2 secondary
+STRESS_VELOCITY = np.array([64, 100, 84], dtype=np.uint8)
+
+# The syllables of many lines, flattened: line i covers texts[line_offsets[i]:line_offsets[i + 1]]
+SyllableBatch = namedtuple("SyllableBatch", ["texts", "stress", "line_offsets"])
+
+
+def _keeps_final_e(word, group):
+    """
+    Whether a final "e", "es" or "ed" is sounded: "ta-ble", "ro-ses", "need-ed" but not "stay-ed".
+    """
+    tail = word[group.end():]
+    if tail not in ("", "s", "d") or group.start() < 2:
+        return True
+    before = word[group.start() - 1]
+    if tail in ("", "s") and before == "l" and word[group.start() - 2] not in VOWELS:
+        return True
+    return (tail == "s" and before in "szxcg") or (tail == "d" and before in "td")
+
+
+def split_syllables(word):
+    """
+    Spelling-based syllable split, e.g. "complexity" -> ["com", "plex", "i", "ty"].
+    Digits are one syllable each.
+    """
+    if word.isdigit():
+        return list(word)
+    lower = word.lower()
+    groups = list(_vowel_group.finditer(lower))
+    if len(groups) > 1 and groups[-1].group() == "e" and not _keeps_final_e(lower, groups[-1]):
+        groups.pop()
+    if len(groups) < 2:
+        return [word]
+
+    cuts = [0]
+    for previous, current in zip(groups, groups[1:]):
+        consonants = lower[previous.end():current.start()]
+        if consonants == "x":
+            cut = current.start()  # "com-plex-i-ty"
+        elif len(consonants) <= 1 or consonants in DIGRAPHS:
+            cut = previous.end()
+        elif current is groups[-1] and current.group() == "e" and lower[current.start() - 1] == "l":
+            cut = current.start() - 2  # "ta-ble", "cy-cle"
+        elif len(consonants) > 3 and consonants[-3:] in TRIPLE_ONSETS:
+            cut = current.start() - 3  # "en-thrall"
+        elif len(consonants) > 2 and consonants[-2:] in ONSETS:
+            cut = current.start() - 2  # "com-plex"
+        elif len(consonants) > 2:
+            cut = current.start() - 1  # "func-tion"
+        else:
+            cut = previous.end() + 1
+        cuts.append(cut)
+    cuts.append(len(word))
+    return [word[start:end] for start, end in zip(cuts, cuts[1:])]
+
+
+def estimate_stress(word, count):
+    """
+    Guess the stress of a word's syllables: function words are unstressed, other words stress
+    the first syllable, the second after a common prefix, and the one before "-tion"/"-ic"/"-ity" endings.
+    """
+    stress = [0] * count
+    lower = word.lower()
+    if count == 1:
+        stress[0] = 0 if lower in FUNCTION_WORDS else 1
+        return stress
+    index = 0
+    if lower.endswith(("tion", "sion", "ic")):
+        index = count - 2
+    elif lower.endswith("ity"):
+        index = max(count - 3, 0)
+    elif lower.startswith(UNSTRESSED_PREFIXES):
+        index = 1
+    stress[index] = 1
+    return stress
+
+
+@lru_cache(maxsize=65536)
+def syllabify(word):
+    """
+    Syllables and stresses of a single word (memoized, since lyric vocabularies repeat heavily).
+    Every syllable but the last carries a trailing hyphen, as in MIDI lyric events.
+
+    Returns:
+        tuple: (syllable texts, stresses), both tuples.
+    """
+    parts = split_syllables(word)
+    stress = None
+    if pronouncing is not None:
+        phones = pronouncing.phones_for_word(word.lower())
+        if phones:
+            stress = [int(s) for s in pronouncing.stresses(phones[0])]
+            if len(stress) != len(parts):
+                stress = None
+    if stress is None:
+        stress = estimate_stress(word, len(parts))
+    texts = tuple(part + "-" for part in parts[:-1]) + (parts[-1],)
+    return texts, tuple(stress)
+
+
+def syllabify_lines(lines):
+    """
+    Syllabify many lines into flat arrays. Words come from the cache, so repeated vocabulary
+    costs a dictionary lookup and no new per-syllable objects.
+
+    Returns:
+        SyllableBatch
+    """
+    words = [[syllabify(word) for word in _word_pattern.findall(line)] for line in lines]
+    counts = [sum(len(texts) for texts, _ in line) for line in words]
+    flat = list(chain.from_iterable(words))
+    texts = list(chain.from_iterable(texts for texts, _ in flat))
+    stress = np.fromiter(chain.from_iterable(stress for _, stress in flat), dtype=np.uint8, count=len(texts))
+    line_offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+    return SyllableBatch(texts, stress, line_offsets)
+
+
+def line_index(batch):
+    """
+    Line number of every syllable.
+    """
+    return np.repeat(np.arange(len(batch.line_offsets) - 1), np.diff(batch.line_offsets))
+
+
+def _layout(batch, tempo_map):
+    """
+    Syllable durations, then the syllable total, start tick and whole-bar length of every line.
+    """
+    ppq = tempo_map.ppq
+    bar = tempo_map.ticks_per_bar()
+    lines = line_index(batch)
+    num_lines = len(batch.line_offsets) - 1
+    durations = np.where(batch.stress > 0, ppq, ppq // 2).astype(np.int64)
+    line_totals = np.bincount(lines, weights=durations, minlength=num_lines).astype(np.int64)
+    line_lengths = -(-line_totals // bar) * bar
+    line_starts = np.concatenate(([0], np.cumsum(line_lengths)[:-1])).astype(np.int64)
+    return durations, line_totals, line_starts, line_lengths
+
+
+def line_layout(batch, tempo_map=DEFAULT_TEMPO_MAP):
+    """
+    The bar grid of the aligned melody: where every line starts and how long it lasts, in ticks.
+    Lines start on bar lines and last whole bars (lines without syllables last 0 ticks), so
+    other parts can be laid out on the same bars.
+
+    Returns:
+        tuple: (line_starts, line_lengths) arrays, one entry per line.
+    """
+    _, _, line_starts, line_lengths = _layout(batch, tempo_map)
+    return line_starts, line_lengths
+
+
+def align_notes(batch, palette_ids, palettes, tempo_map=DEFAULT_TEMPO_MAP, seed=None, channel=0):
+    """
+    Give every syllable its own note. Stressed syllables get a beat and a louder note, unstressed
+    ones half a beat; each line starts on a bar line and its last syllable is held to the end of the bar.
+
+    Args:
+        batch (SyllableBatch): The syllables of the song.
+        palette_ids (array): Index into `palettes` for every line.
+        palettes (list): Lists of MIDI note numbers the pitches are drawn from.
+        tempo_map (TempoMap): Gives the beat and bar length.
+        seed (int): Seed of the pitch choices (fresh randomness when None).
+        channel (int): MIDI channel of the notes.
+
+    Returns:
+        np.ndarray: NOTE_DTYPE array, one note per syllable in syllable order.
+    """
+    lines = line_index(batch)
+    # Lay the lines out bar by bar
+    durations, line_totals, line_starts, line_lengths = _layout(batch, tempo_map)
+    elapsed = np.concatenate(([0], np.cumsum(durations)))
+    starts = line_starts[lines] + elapsed[:-1] - elapsed[batch.line_offsets[:-1]][lines]
+
+    # Hold the last syllable of every line until the line ends
+    last = batch.line_offsets[1:][line_totals > 0] - 1
+    durations[last] = (line_starts + line_lengths)[line_totals > 0] - starts[last]
+
+    sizes = np.array([len(palette) for palette in palettes], dtype=np.int64)
+    first = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    pitches = np.concatenate([np.asarray(palette, dtype=np.int64) for palette in palettes])
+    ids = np.asarray(palette_ids, dtype=np.int64)[lines]
+    picks = (np.random.default_rng(seed).random(len(lines)) * sizes[ids]).astype(np.int64)
+
+    notes = np.empty(len(lines), dtype=NOTE_DTYPE)
+    notes['start'] = starts
+    notes['duration'] = durations
+    notes['channel'] = channel
+    notes['note'] = pitches[first[ids] + picks]
+    notes['velocity'] = STRESS_VELOCITY[batch.stress]
+    return notes
+
+
+@lru_cache(maxsize=65536)
+def _lyric_message(text):
+    return MetaMessage('lyrics', text=text)
+
+
+def lyric_messages(batch, notes):
+    """
+    MIDI lyric meta events for aligned notes, as (absolute tick, MetaMessage) pairs.
+    Messages are shared between repeated syllables; timebase.notes_to_track copies them when timing them.
+    """
+    return [
+        (tick, _lyric_message(text))
+        for tick, text in zip(notes['start'].tolist(), batch.texts)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Syllabify a lyric corpus (one line per row).")
+    parser.add_argument("corpus", nargs="+", help="Text files with one lyric line per row.")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Lines per batch.")
+    args = parser.parse_args()
+
+    num_lines = num_syllables = num_stressed = 0
+    for path in args.corpus:
+        with open(path, encoding="utf-8") as f, stage("syllabify", corpus=path):
+            lines = (line.strip() for line in f if line.strip() and not line.startswith("["))
+            while True:
+                chunk = list(islice(lines, args.chunk_size))
+                if not chunk:
+                    break
+                batch = syllabify_lines(chunk)
+                num_lines += len(chunk)
+                num_syllables += len(batch.texts)
+                num_stressed += int(np.count_nonzero(batch.stress))
+
+    info = syllabify.cache_info()
+    print(f"{num_lines} lines, {num_syllables} syllables ({num_stressed} stressed)")
+    print(f"{info.currsize} distinct words, {info.hits / max(info.hits + info.misses, 1):.0%} cache hits")
+
+
+if __name__ == "__main__":
+    with profiled_run("syllables"):
+        main()
@@ -0,0 +1,105 @@
+import random
+from collections import Counter
+
+import pytest
+
+from fenwick import WeightedSampler
+
+
+def draw(sampler, count, seed=0):
+    rng = random.Random(seed)
+    return Counter(sampler.sample(rng) for _ in range(count))
+
+
+def check_tree(sampler):
+    """
+    The tree agrees with the weights, and the bookkeeping with the items.
+    """
+    assert sampler.total == pytest.approx(sum(sampler.weights))
+    assert sampler.positive == sum(1 for weight in sampler.weights if weight > 0)
+    assert len(sampler) == sum(1 for item in sampler.items if item is not None)
+    for item in sampler:
+        assert sampler.items[sampler.slots[item]] == item
+
+
+def test_set_remove_and_regrow():
+    sampler = WeightedSampler({'A': 1.0, 'B': 2.0})
+    sampler.set('B', 5.0)
+    assert sampler.weight('B') == 5.0
+    assert sampler.total == pytest.approx(6.0)
+
+    # Adding past the capacity doubles it; removed slots are reused
+    for i in range(10):
+        sampler.set(i, i + 1)
+    assert len(sampler) == 12 and len(sampler.weights) == 16
+    sampler.remove('A')
+    sampler.remove(3)
+    assert 'A' not in sampler and 3 not in sampler
+    sampler.set('C', 2.5)
+    assert len(sampler.weights) == 16
+    check_tree(sampler)
+
+    with pytest.raises(ValueError):
+        sampler.set('C', -1.0)
+    with pytest.raises(KeyError):
+        sampler.remove('A')
+
+
+def test_never_draws_removed_or_zero_items():
+    sampler = WeightedSampler({'A': 1.0, 'B': 1.0, 'C': 1.0})
+    sampler.remove('A')
+    sampler.set('B', 0.0)
+    assert set(draw(sampler, 500)) == {'C'}
+
+    sampler.set('C', 0.0)
+    assert sampler.sample() is None
+    assert WeightedSampler().sample() is None
+
+
+def test_distribution():
+    weights = {'I': 0.5, 'IV': 0.3, 'V': 0.15, 'vi': 0.05}
+    sampler = WeightedSampler(weights)
+    counts = draw(sampler, 20000)
+    for item, weight in weights.items():
+        assert counts[item] / 20000 == pytest.approx(weight, abs=0.015)
+
+    # An edit applies from the next draw on
+    sampler.set('vi', 4.0)
+    sampler.remove('I')
+    counts = draw(sampler, 20000, seed=1)
+    assert 'I' not in counts
+    assert counts['vi'] / 20000 == pytest.approx(4.0 / 4.45, abs=0.015)
+
+
+def test_cancelled_weights_do_not_hang():
+    # The float delta that zeroes A also wipes out B's contribution to the partial sums
+    sampler = WeightedSampler({'A': 1e20, 'B': 1.0})
+    sampler.set('A', 0)
+    assert sampler.sample() == 'B'
+    check_tree(sampler)
+
+    sampler = WeightedSampler({'A': 1e20, 'B': 1.0, 'C': 1.0})
+    sampler.remove('A')
+    assert set(draw(sampler, 200)) == {'B', 'C'}
+    check_tree(sampler)
+
+
+def test_many_live_edits_keep_the_tree_exact():
+    rng = random.Random(7)
+    sampler = WeightedSampler()
+    reference = {}
+    for _ in range(5000):
+        item = rng.randrange(50)
+        if item in reference and rng.random() < 0.3:
+            sampler.remove(item)
+            del reference[item]
+        else:
+            weight = rng.choice([0.0, 1e-3, 1.0, 1e6, 1e18]) * rng.random()
+            sampler.set(item, weight)
+            reference[item] = weight
+        drawn = sampler.sample(rng)
+        if any(weight > 0 for weight in reference.values()):
+            assert reference[drawn] > 0
+        else:
+            assert drawn is None
+    check_tree(sampler)
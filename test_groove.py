@@ -0,0 +1,77 @@
+import sys
+
+import numpy as np
+from mido import Message, MetaMessage, MidiFile, MidiTrack
+
+import groove
+from groove import DEFAULT_GROOVE, apply_groove, groove_track
+from timebase import TempoMap, notes_to_track, split_track
+from test_timebase import make_notes, check_track
+
+
+def test_groove_keeps_notes_paired():
+    # Repeated pitches a few ticks apart and chords starting together, so the jitter
+    # makes notes overlap, collide and reorder
+    rows = []
+    for beat in range(64):
+        start = beat * 240
+        rows += [(start, 250, 60), (start, 120, 64), (start, 120, 67), (start + 5, 200, 60)]
+    notes = make_notes(rows)
+    track = MidiTrack([MetaMessage('track_name', name='Test', time=0)])
+    track.extend(notes_to_track(notes))
+    track.append(Message('note_on', note=72, velocity=80, time=30))  # unmatched
+
+    for seed in range(5):
+        groove = DEFAULT_GROOVE._replace(jitter=40, seed=seed)
+        grooved = groove_track(track, groove, rng=np.random.default_rng(seed))
+        check_track(grooved)
+        assert grooved[0].type == 'track_name'
+        grooved_notes, _ = split_track(grooved)
+        assert (grooved_notes['start'] >= 0).all()
+        assert (grooved_notes['duration'] >= 1).all()
+        assert np.all(np.diff(grooved_notes['start']) >= 0)
+        assert 72 not in grooved_notes['note']
+
+        # The same seed gives the same track
+        again = groove_track(track, groove, rng=np.random.default_rng(seed))
+        assert [msg.bytes() for msg in again] == [msg.bytes() for msg in grooved]
+
+
+def test_groove_moves_lyrics_with_their_notes():
+    notes = make_notes([(i * 240, 200, 60 + i % 5) for i in range(32)])
+    syllables = [f"la{i}" for i in range(32)]
+    lyrics = [(int(start), MetaMessage('lyrics', text=text)) for start, text in zip(notes['start'], syllables)]
+    track = notes_to_track(notes, lyrics)
+
+    grooved = groove_track(track, DEFAULT_GROOVE._replace(jitter=40), rng=np.random.default_rng(1))
+    check_track(grooved)
+    messages = list(grooved)
+    texts = []
+    for msg, following in zip(messages, messages[1:]):
+        if msg.type == 'lyrics':
+            texts.append(msg.text)
+            # Each syllable comes right before its own note
+            assert following.type == 'note_on' and following.time == 0
+            assert following.note == 60 + int(msg.text[2:]) % 5
+    assert texts == syllables
+
+
+def test_velocity_curve_follows_the_time_signature(tmp_path, monkeypatch):
+    # One note per beat over four bars of 3/4, all at the same velocity
+    notes = make_notes([(beat * 480, 240, 60) for beat in range(12)])
+    tempo_map = TempoMap(time_signatures=[(0, 3, 4)])
+    flat = DEFAULT_GROOVE._replace(swing=0, jitter=0, velocity_curve=(1.2, 0.8, 0.8, 0.8))
+    velocities = apply_groove(notes, flat, tempo_map)['velocity'].tolist()
+    assert velocities == [96, 64, 64] * 4
+
+    # The command line reads the time signature from the file
+    midi = MidiFile(ticks_per_beat=480)
+    midi.tracks.append(tempo_map.conductor_track())
+    midi.tracks.append(notes_to_track(notes))
+    midi.save(tmp_path / "in.mid")
+    monkeypatch.setattr(sys, "argv", ["groove.py", str(tmp_path / "in.mid"), str(tmp_path / "out.mid"),
+                                      "--swing", "0", "--jitter", "0"])
+    groove.main()
+    grooved, _ = split_track(MidiFile(tmp_path / "out.mid").tracks[1])
+    curve = DEFAULT_GROOVE.velocity_curve
+    assert grooved['velocity'].tolist() == [round(80 * curve[beat]) for beat in (0, 1, 2)] * 4
@@ -0,0 +1,136 @@
+import numpy as np
+from mido import Message, MidiFile, MidiTrack
+
+from timebase import (NOTE_DTYPE, TempoMap, events_to_notes, notes_to_track, remove_overlaps,
+                      rescale_track, split_track, track_to_events)
+
+
+def make_track(events):
+    """
+    Build a track from (absolute tick, kind, note) triples, in order.
+    """
+    track = MidiTrack()
+    previous = 0
+    for tick, kind, note in events:
+        track.append(Message(kind, note=note, velocity=80 if kind == 'note_on' else 0, time=tick - previous))
+        previous = tick
+    return track
+
+
+def make_notes(rows):
+    """
+    NOTE_DTYPE array from (start, duration, note) triples on channel 0.
+    """
+    notes = np.zeros(len(rows), dtype=NOTE_DTYPE)
+    for i, (start, duration, note) in enumerate(rows):
+        notes[i] = (start, duration, 0, note, 80)
+    return notes
+
+
+def check_track(track):
+    """
+    Every note_on starts a silent pitch, every note_off ends a sounding one, no delta is
+    negative and nothing is left sounding at the end.
+    """
+    sounding = set()
+    for msg in track:
+        assert msg.time >= 0
+        if msg.type == 'note_on' and msg.velocity > 0:
+            assert (msg.channel, msg.note) not in sounding
+            sounding.add((msg.channel, msg.note))
+        elif msg.type in ('note_on', 'note_off'):
+            assert (msg.channel, msg.note) in sounding
+            sounding.remove((msg.channel, msg.note))
+    assert not sounding
+
+
+def test_seconds_across_tempo_changes():
+    tempo_map = TempoMap(tempos=[(0, 120), (960, 60), (2400, 240)])
+    # Two beats at 120 bpm, three at 60 bpm, then 240 bpm
+    seconds = tempo_map.ticks_to_seconds([0, 480, 960, 1440, 2400, 2880])
+    assert np.allclose(seconds, [0.0, 0.5, 1.0, 2.0, 4.0, 4.25])
+
+    ticks = np.arange(0, 5000, 7)
+    assert (tempo_map.seconds_to_ticks(tempo_map.ticks_to_seconds(ticks)) == ticks).all()
+    assert (tempo_map.beats_to_ticks(tempo_map.ticks_to_beats(ticks)) == ticks).all()
+
+
+def test_bar_positions_across_time_signature_changes():
+    # 4/4, then 3/4 from halfway through the second bar, then 6/8
+    tempo_map = TempoMap(time_signatures=[(0, 4, 4), (2400, 3, 4), (3840, 6, 8)])
+    bars, offsets = tempo_map.bar_positions([0, 1919, 1920, 2399, 2400, 3839, 3840, 5280])
+    # The new signature starts a new bar; the cut-short bar before it keeps its number
+    assert bars.tolist() == [0, 0, 1, 1, 2, 2, 3, 4]
+    assert offsets.tolist() == [0, 1919, 0, 479, 0, 1439, 0, 0]
+    assert [tempo_map.ticks_per_bar(tick) for tick in (0, 2400, 3840)] == [1920, 1440, 1440]
+
+    # Bar numbers never go back and every bar starts at offset 0
+    ticks = np.arange(0, 10000)
+    bars, offsets = tempo_map.bar_positions(ticks)
+    assert (np.diff(bars) >= 0).all()
+    assert (offsets[np.flatnonzero(np.diff(bars)) + 1] == 0).all()
+
+
+def test_tempo_map_round_trips_through_midi():
+    tempo_map = TempoMap(tempos=[(0, 90), (1920, 150)], time_signatures=[(0, 3, 4), (2880, 6, 8)], ppq=240)
+    midi = MidiFile(ticks_per_beat=240)
+    midi.tracks.append(tempo_map.conductor_track())
+    loaded = TempoMap.from_midi(midi)
+    assert loaded.time_signatures == tempo_map.time_signatures
+    assert loaded.tempo_ticks.tolist() == tempo_map.tempo_ticks.tolist()
+    assert loaded.tempos.tolist() == tempo_map.tempos.tolist()
+    assert loaded.ppq == 240
+
+
+def test_rescale_track_does_not_accumulate_rounding():
+    track = MidiTrack(Message('note_on', note=60, time=delta) for delta in [0, 1, 3, 7, 1, 1, 1, 100] * 20)
+    assert rescale_track(track, 480, 480) is track
+
+    rescaled = rescale_track(track, 100, 480)
+    old_ticks = np.cumsum([msg.time for msg in track])
+    new_ticks = np.cumsum([msg.time for msg in rescaled])
+    # Absolute ticks are scaled and rounded once, so the error stays below one tick at any point
+    assert (np.abs(new_ticks - old_ticks * 4.8) <= 0.5).all()
+    assert [msg.note for msg in rescaled] == [msg.note for msg in track]
+
+    # Scaling up and back down restores the track
+    back = rescale_track(rescale_track(track, 96, 480), 480, 96)
+    assert [msg.time for msg in back] == [msg.time for msg in track]
+
+
+def test_overlapping_repeats_pair_in_order():
+    # The k-th note_on of a pitch pairs with its k-th note_off
+    track = make_track([(0, 'note_on', 60), (100, 'note_on', 60), (200, 'note_off', 60), (300, 'note_off', 60)])
+    notes = events_to_notes(track_to_events(track))
+    assert notes['start'].tolist() == [0, 100]
+    assert notes['duration'].tolist() == [200, 200]
+
+    # Rebuilt, the first note is released before the repeat starts
+    rebuilt = notes_to_track(notes)
+    check_track(rebuilt)
+    assert events_to_notes(track_to_events(rebuilt))['duration'].tolist() == [100, 200]
+
+
+def test_unmatched_events_are_dropped():
+    track = make_track([
+        (0, 'note_off', 64),   # note_off without a note_on
+        (0, 'note_on', 62),    # note_on never released
+        (10, 'note_on', 60),
+        (50, 'note_off', 60),
+        (60, 'note_off', 65),  # released before it starts
+        (70, 'note_on', 65),
+    ])
+    notes = events_to_notes(track_to_events(track))
+    assert notes['note'].tolist() == [60]
+    assert notes['start'].tolist() == [10]
+    assert notes['duration'].tolist() == [40]
+
+
+def test_same_tick_starts():
+    notes = make_notes([(0, 100, 60), (0, 100, 64), (0, 50, 60), (100, 100, 60)])
+    merged = remove_overlaps(notes)
+    # The two notes of pitch 60 starting together become one; the other pitch is untouched
+    assert sorted(zip(merged['start'].tolist(), merged['note'].tolist())) == [(0, 60), (0, 64), (100, 60)]
+
+    # At tick 100 pitch 60 is released before it starts again
+    check_track(notes_to_track(notes))
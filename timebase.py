@@ -0,0 +1,309 @@
+import numpy as np
+from mido import Message, MetaMessage, MidiTrack, bpm2tempo, tempo2bpm
+
+# Shared timebase of every generated track: ticks per quarter note (beat)
+PPQ = 480
+DEFAULT_BPM = 120
+
+# Note events of a track as one structured array, ticks absolute
+EVENT_DTYPE = np.dtype([
+    ('tick', np.int64),
+    ('on', np.bool_),
+    ('channel', np.uint8),
+    ('note', np.uint8),
+    ('velocity', np.uint8),
+])
+
+# Notes as one structured array: onset and length in ticks
+NOTE_DTYPE = np.dtype([
+    ('start', np.int64),
+    ('duration', np.int64),
+    ('channel', np.uint8),
+    ('note', np.uint8),
+    ('velocity', np.uint8),
+])
+
+# Meta messages that belong to the shared conductor track, not to individual tracks
+CONDUCTOR_META_TYPES = ('set_tempo', 'time_signature')
+
+
+class TempoMap:
+    """
+    Tempo changes and time signatures of a song on the shared PPQ timebase.
+    Conversions between ticks, beats and seconds work on whole NumPy arrays at once.
+    """
+
+    def __init__(self, tempos=((0, DEFAULT_BPM),), time_signatures=((0, 4, 4),), ppq=PPQ):
+        """
+        Args:
+            tempos (iterable): (tick, bpm) pairs; the first must be at tick 0.
+            time_signatures (iterable): (tick, numerator, denominator) triples; the first must be at tick 0.
+            ppq (int): Ticks per quarter note.
+        """
+        tempos = sorted(tempos)
+        time_signatures = sorted(time_signatures)
+        if tempos[0][0] != 0 or time_signatures[0][0] != 0:
+            raise ValueError("The first tempo and time signature must start at tick 0")
+        self.ppq = ppq
+        self.tempo_ticks = np.array([tick for tick, _ in tempos], dtype=np.int64)
+        self.tempos = np.array([bpm2tempo(bpm) for _, bpm in tempos], dtype=np.int64)  # us per beat
+        self.time_signatures = [(int(tick), int(num), int(den)) for tick, num, den in time_signatures]
+
+        # Seconds elapsed at every tempo change
+        seconds_per_tick = self.tempos / (self.ppq * 1e6)
+        spans = np.diff(self.tempo_ticks) * seconds_per_tick[:-1]
+        self.tempo_seconds = np.concatenate(([0.0], np.cumsum(spans)))
+
+    @classmethod
+    def from_midi(cls, midi):
+        """
+        Read the tempo map of a mido MidiFile from the tempo and time signature messages of all its tracks.
+        """
+        tempos = {}
+        time_signatures = {}
+        for track in midi.tracks:
+            tick = 0
+            for msg in track:
+                tick += msg.time
+                if msg.type == 'set_tempo':
+                    tempos[tick] = tempo2bpm(msg.tempo)
+                elif msg.type == 'time_signature':
+                    time_signatures[tick] = (msg.numerator, msg.denominator)
+        tempos.setdefault(0, DEFAULT_BPM)
+        time_signatures.setdefault(0, (4, 4))
+        return cls(
+            tempos=tempos.items(),
+            time_signatures=[(tick, num, den) for tick, (num, den) in time_signatures.items()],
+            ppq=midi.ticks_per_beat,
+        )
+
+    @property
+    def bpm(self):
+        """
+        Tempo at the start of the song.
+        """
+        return tempo2bpm(int(self.tempos[0]))
+
+    def ticks_to_seconds(self, ticks):
+        ticks = np.asarray(ticks, dtype=np.int64)
+        i = np.searchsorted(self.tempo_ticks, ticks, side='right') - 1
+        return self.tempo_seconds[i] + (ticks - self.tempo_ticks[i]) * self.tempos[i] / (self.ppq * 1e6)
+
+    def seconds_to_ticks(self, seconds):
+        seconds = np.asarray(seconds, dtype=np.float64)
+        i = np.searchsorted(self.tempo_seconds, seconds, side='right') - 1
+        ticks = self.tempo_ticks[i] + (seconds - self.tempo_seconds[i]) * self.ppq * 1e6 / self.tempos[i]
+        return np.rint(ticks).astype(np.int64)
+
+    def ticks_to_beats(self, ticks):
+        return np.asarray(ticks, dtype=np.int64) / self.ppq
+
+    def beats_to_ticks(self, beats):
+        return np.rint(np.asarray(beats, dtype=np.float64) * self.ppq).astype(np.int64)
+
+    def ticks_per_bar(self, tick=0):
+        """
+        Length of a bar in ticks under the time signature in effect at `tick`.
+        """
+        _, numerator, denominator = [ts for ts in self.time_signatures if ts[0] <= tick][-1]
+        return numerator * self.ppq * 4 // denominator
+
+    def bar_positions(self, ticks):
+        """
+        Bar number and tick offset within the bar for every tick.
+
+        Returns:
+            tuple: (bars, offsets) arrays.
+        """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        starts = np.array([tick for tick, _, _ in self.time_signatures], dtype=np.int64)
+        bar_lengths = np.array([num * self.ppq * 4 // den for _, num, den in self.time_signatures], dtype=np.int64)
+        # Bars completed before each time signature change
+        first_bars = np.concatenate(([0], np.cumsum(-(-np.diff(starts) // bar_lengths[:-1]))))
+        i = np.searchsorted(starts, ticks, side='right') - 1
+        since = ticks - starts[i]
+        return first_bars[i] + since // bar_lengths[i], since % bar_lengths[i]
+
+    def meta_messages(self):
+        """
+        Tempo and time signature meta messages as (absolute tick, MetaMessage) pairs.
+        """
+        events = [
+            (tick, MetaMessage('time_signature', numerator=num, denominator=den, time=0))
+            for tick, num, den in self.time_signatures
+        ]
+        events += [
+            (int(tick), MetaMessage('set_tempo', tempo=int(tempo), time=0))
+            for tick, tempo in zip(self.tempo_ticks, self.tempos)
+        ]
+        return sorted(events, key=lambda event: event[0])
+
+    def header_messages(self):
+        """
+        Delta-timed tempo and time signature messages, for the start of a single-track file.
+        """
+        messages = []
+        previous = 0
+        for tick, msg in self.meta_messages():
+            messages.append(msg.copy(time=tick - previous))
+            previous = tick
+        return messages
+
+    def conductor_track(self, name="Conductor"):
+        """
+        A track holding only the tempo map, for the first track of a multi-track file.
+        """
+        track = MidiTrack()
+        track.append(MetaMessage('track_name', name=name, time=0))
+        track.extend(self.header_messages())
+        return track
+
+
+DEFAULT_TEMPO_MAP = TempoMap()
+
+
+def track_to_events(track):
+    """
+    Collect the note events of a track into an EVENT_DTYPE array with absolute ticks.
+    """
+    deltas = np.fromiter((msg.time for msg in track), dtype=np.int64, count=len(track))
+    ticks = np.cumsum(deltas)
+    rows = [
+        (tick, msg.type == 'note_on' and msg.velocity > 0, msg.channel, msg.note, msg.velocity)
+        for tick, msg in zip(ticks.tolist(), track)
+        if msg.type in ('note_on', 'note_off')
+    ]
+    return np.array(rows, dtype=EVENT_DTYPE)
+
+
+def rescale_track(track, source_ppq, target_ppq=PPQ):
+    """
+    Move a track written at another resolution onto the shared timebase.
+    Absolute ticks are scaled in one vectorized step, so rounding never accumulates.
+    """
+    if source_ppq == target_ppq:
+        return track
+    deltas = np.fromiter((msg.time for msg in track), dtype=np.int64, count=len(track))
+    ticks = np.rint(np.cumsum(deltas) * (target_ppq / source_ppq)).astype(np.int64)
+    new_deltas = np.diff(ticks, prepend=0)
+    return MidiTrack(msg.copy(time=delta) for msg, delta in zip(track, new_deltas.tolist()))
+
+
+def _rank_within(keys):
+    """
+    Position of every element among the elements with the same key (keys already sorted).
+    """
+    return np.arange(len(keys)) - np.searchsorted(keys, keys, side='left')
+
+
+def events_to_notes(events):
+    """
+    Pair note_on and note_off events into notes. The k-th note_on of a (channel, note) pairs with
+    its k-th note_off; unmatched events are dropped.
+
+    Returns:
+        np.ndarray: NOTE_DTYPE array sorted by onset.
+    """
+    on = events[events['on']]
+    off = events[~events['on']]
+    on_keys = on['channel'].astype(np.int64) * 128 + on['note']
+    off_keys = off['channel'].astype(np.int64) * 128 + off['note']
+    on = on[np.lexsort((on['tick'], on_keys))]
+    off = off[np.lexsort((off['tick'], off_keys))]
+    on_keys = on['channel'].astype(np.int64) * 128 + on['note']
+    off_keys = off['channel'].astype(np.int64) * 128 + off['note']
+
+    # Match (key, rank) between both sides
+    limit = max(len(on), len(off)) + 1
+    _, on_index, off_index = np.intersect1d(
+        on_keys * limit + _rank_within(on_keys),
+        off_keys * limit + _rank_within(off_keys),
+        assume_unique=True, return_indices=True,
+    )
+    on, off = on[on_index], off[off_index]
+    valid = off['tick'] > on['tick']
+
+    notes = np.empty(np.count_nonzero(valid), dtype=NOTE_DTYPE)
+    notes['start'] = on['tick'][valid]
+    notes['duration'] = off['tick'][valid] - on['tick'][valid]
+    notes['channel'] = on['channel'][valid]
+    notes['note'] = on['note'][valid]
+    notes['velocity'] = on['velocity'][valid]
+    return notes[np.argsort(notes['start'], kind='stable')]
+
+
+def remove_overlaps(notes):
+    """
+    Shorten notes that would still be sounding when the same pitch starts again on the same
+    channel, so every note_on keeps its own note_off. Notes starting together are merged.
+    """
+    keys = notes['channel'].astype(np.int64) * 128 + notes['note']
+    order = np.lexsort((notes['start'], keys))
+    notes = notes[order]
+    keys = keys[order]
+    same = keys[1:] == keys[:-1]
+    gaps = notes['start'][1:] - notes['start'][:-1]
+    keep = np.ones(len(notes), dtype=bool)
+    keep[:-1] = ~(same & (gaps == 0))
+    clipped = np.minimum(notes['duration'][:-1], np.where(same, gaps, np.iinfo(np.int64).max))
+    notes['duration'][:-1] = np.maximum(clipped, 1)
+    notes = notes[keep]
+    return notes[np.argsort(notes['start'], kind='stable')]
+
+
+def notes_to_track(notes, other_messages=()):
+    """
+    Build a delta-timed track from a note array.
+    At equal ticks note_offs come first, then the other messages, then note_ons, so a repeated
+    pitch is released before it restarts and a lyric event directly precedes its note.
+
+    Args:
+        notes (np.ndarray): NOTE_DTYPE array.
+        other_messages (iterable): (absolute tick, message) pairs to keep, e.g. track names,
+            in order.
+    """
+    notes = remove_overlaps(notes)
+    other_messages = list(other_messages)
+    count = len(notes)
+    ticks = np.concatenate((
+        np.array([tick for tick, _ in other_messages], dtype=np.int64),
+        notes['start'] + notes['duration'],
+        notes['start'],
+    ))
+    kinds = np.concatenate((
+        np.ones(len(other_messages), dtype=np.int8),
+        np.zeros(count, dtype=np.int8),
+        np.full(count, 2, dtype=np.int8),
+    ))
+    order = np.lexsort((kinds, ticks))
+    deltas = np.diff(ticks[order], prepend=0).tolist()
+
+    channels = notes['channel'].tolist()
+    pitches = notes['note'].tolist()
+    velocities = notes['velocity'].tolist()
+    track = MidiTrack()
+    for i, delta in zip(order.tolist(), deltas):
+        if i < len(other_messages):
+            track.append(other_messages[i][1].copy(time=delta))
+            continue
+        j = i - len(other_messages)
+        kind = 'note_off' if j < count else 'note_on'
+        j %= count
+        track.append(Message(kind, channel=channels[j], note=pitches[j], velocity=velocities[j], time=delta))
+    return track
+
+
+def split_track(track):
+    """
+    Split a track into its notes and every other message (end_of_track left out).
+
+    Returns:
+        tuple: (NOTE_DTYPE array, list of (absolute tick, message) pairs)
+    """
+    tick = 0
+    other = []
+    for msg in track:
+        tick += msg.time
+        if msg.type not in ('note_on', 'note_off', 'end_of_track'):
+            other.append((tick, msg))
+    return events_to_notes(track_to_events(track)), other